@@ -0,0 +1,213 @@
+"""
+    Archive every finished tournament board, so bots can be studied
+    without playing their games again.
+
+    An archive is a directory of
+        index.bin       one fixed size INDEX record per game, appended
+        names.json      column names, numbered as in index and chunks
+        players.json    [name, syn] of players, numbered as in index
+        chunk_N.npz     the boards of CHUNK games, compressed
+
+    A chunk has "values", every board one after the other, each column
+    in turn (so a board is a cols x rows block), and "columns", the name
+    number of each board column. A game's record gives its chunk and
+    where its values and columns start, with its players, victory types
+    and columns, seed and winner.
+
+    The index is read with np.memmap, so scanning millions of games
+    only reads the pages used. Boards are decompressed a chunk at a time,
+    so memory is bounded by CHUNK whatever the size of the archive.
+
+    Archive.add() only queues a board. A background thread builds and
+    compresses each chunk, writes it to a temporary file and renames it,
+    then appends its index records. A crash loses at most the games not
+    yet in a chunk, and a torn index record is dropped on open.
+"""
+import json
+import os
+import queue
+import time
+import numpy as np
+from threading import Thread
+
+CHUNK = 1000   # games in a chunk
+
+INDEX = np.dtype([("game", "<i8"), ("time", "<f8"), ("seed", "<i8"),
+                  ("chunk", "<i4"), ("offset", "<i8"), ("column", "<i4"),
+                  ("rows", "<i4"), ("cols", "<i4"),
+                  ("player1", "<i4"), ("player2", "<i4"), ("vt1", "<i1"), ("vt2", "<i1"),
+                  ("col1", "<i4"), ("col2", "<i4"), ("winner", "<i1")])
+
+def chunk_file(path, n):
+    return os.path.join(path, "chunk_{:06d}.npz".format(n))
+
+def read_table(fname):
+    if not os.path.exists(fname):
+        return []
+    with open(fname) as f:
+        return json.load(f)
+
+def write_table(fname, table):
+    tmp = fname + ".tmp"
+    with open(tmp, "w") as f:
+        json.dump(table, f)
+    os.replace(tmp, fname)
+
+class Archive:
+    def __init__(self, path, dtype=np.float64):
+        """Open (or create) the archive in directory path, storing values as dtype.
+           float32 halves the size but keeps only about 7 significant digits.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.index_file = os.path.join(path, "index.bin")
+        self.names = read_table(os.path.join(path, "names.json"))
+        self.players = [tuple(p) for p in read_table(os.path.join(path, "players.json"))]
+        self.name_ids = {k:i for i,k in enumerate(self.names)}
+        self.player_ids = {k:i for i,k in enumerate(self.players)}
+
+        size = os.path.getsize(self.index_file) if os.path.exists(self.index_file) else 0
+        if size % INDEX.itemsize:
+            with open(self.index_file, "r+b") as f:
+                f.truncate(size - size % INDEX.itemsize)
+        self.games = size // INDEX.itemsize
+        self.chunk = 0
+        while os.path.exists(chunk_file(path, self.chunk)):
+            self.chunk += 1
+
+        self.batch = []
+        self.jobs = queue.Queue()
+        self.thread = Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def add(self, k1, k2, vic_type_index1, vic_type_index2, result):
+        """Queue result, a list from Game.run_game, of k1 (as player 1) vs k2."""
+        self.jobs.put((k1, k2, vic_type_index1, vic_type_index2, result, time.time()))
+
+    def flush(self):
+        """Write every board queued so far, in a chunk of its own if need be."""
+        self.jobs.put("flush")
+        self.jobs.join()
+
+    def close(self):
+        """Write the queued boards and stop the thread."""
+        self.jobs.put(None)
+        self.thread.join()
+
+    def work(self):
+        """Background thread: batch boards into chunks until a None job."""
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None or job == "flush":
+                    self.write_chunk()
+                    if job is None:
+                        return
+                else:
+                    self.batch.append(job)
+                    if len(self.batch) >= CHUNK:
+                        self.write_chunk()
+            except Exception as msg:
+                print("Couldn't archive boards: {}".format(msg))
+                self.batch = []
+            finally:
+                self.jobs.task_done()
+
+    def number(self, ids, table, k):
+        if k not in ids:
+            ids[k] = len(table)
+            table.append(k)
+        return ids[k]
+
+    def write_chunk(self):
+        if not self.batch:
+            return
+        records = np.zeros(len(self.batch), dtype=INDEX)
+        values, columns = [], []
+        offset = column = 0
+        for r, (k1, k2, vt1, vt2, result, when) in zip(records, self.batch):
+            board = result[0]
+            names = list(board)
+            rows = len(board[names[0]])
+            values.append(np.array([board[k] for k in names], dtype=self.dtype).ravel())
+            columns += [self.number(self.name_ids, self.names, k) for k in names]
+            r["game"], r["time"], r["seed"] = self.games, when, result[5]
+            r["chunk"], r["offset"], r["column"], r["rows"], r["cols"] = self.chunk, offset, column, rows, len(names)
+            r["player1"] = self.number(self.player_ids, self.players, tuple(k1))
+            r["player2"] = self.number(self.player_ids, self.players, tuple(k2))
+            r["vt1"], r["vt2"] = vt1, vt2
+            r["col1"] = self.number(self.name_ids, self.names, result[1][2])
+            r["col2"] = self.number(self.name_ids, self.names, result[2][2])
+            r["winner"] = result[3]
+            self.games += 1
+            offset += rows * len(names)
+            column += len(names)
+
+            # chunk and tables before the index, so every record points at data
+        tmp = chunk_file(self.path, self.chunk) + ".tmp"
+        with open(tmp, "wb") as f:
+            np.savez_compressed(f, values=np.concatenate(values), columns=np.array(columns, dtype=np.int32))
+        os.replace(tmp, chunk_file(self.path, self.chunk))
+        write_table(os.path.join(self.path, "names.json"), self.names)
+        write_table(os.path.join(self.path, "players.json"), [list(p) for p in self.players])
+        with open(self.index_file, "ab") as f:
+            f.write(records.tobytes())
+        self.chunk += 1
+        self.batch = []
+
+class ArchiveReader:
+    """Read an archive, even one being written."""
+
+    def __init__(self, path):
+        self.path = path
+        self.names = read_table(os.path.join(path, "names.json"))
+        self.players = [tuple(p) for p in read_table(os.path.join(path, "players.json"))]
+        fname = os.path.join(path, "index.bin")
+        n = os.path.getsize(fname) // INDEX.itemsize if os.path.exists(fname) else 0
+        self.index = np.memmap(fname, dtype=INDEX, mode="r", shape=(n,)) if n else np.zeros(0, dtype=INDEX)
+        self.cached = (None, None)   # (chunk number, its arrays)
+
+    def __len__(self):
+        return len(self.index)
+
+    def chunk(self, n):
+        """(values, columns) arrays of chunk n, decompressed."""
+        if self.cached[0] != n:
+            with np.load(chunk_file(self.path, n)) as z:
+                self.cached = (n, (z["values"], z["columns"]))
+        return self.cached[1]
+
+    def board(self, i):
+        """Array cols x rows of game i's board, and list of its column names."""
+        r = self.index[i]
+        values, columns = self.chunk(int(r["chunk"]))
+        block = values[r["offset"] : r["offset"] + r["rows"] * r["cols"]].reshape(r["cols"], r["rows"])
+        return block, [self.names[c] for c in columns[r["column"] : r["column"] + r["cols"]]]
+
+    def game(self, i):
+        """Game i as a dict of its board (as in Game.run_game), players, victory types,
+           victory columns, seed and winner.
+        """
+        from game import Game
+        r = self.index[i]
+        block, names = self.board(i)
+        return {"board": dict(zip(names, block.tolist())),
+                "players": [self.players[r["player1"]], self.players[r["player2"]]],
+                "victory_types": [Game.victory_types[r["vt1"]], Game.victory_types[r["vt2"]]],
+                "victory_columns": [self.names[r["col1"]], self.names[r["col2"]]],
+                "seed": int(r["seed"]), "winner": int(r["winner"])}
+
+    def scan(self, games=None):
+        """Yield (records, values, columns) for each chunk holding any of games
+           (an array of game numbers, default all), where records are the index
+           records of those games in the chunk.
+        """
+        records = self.index if games is None else self.index[np.asarray(games)]
+        records = records[np.argsort(records["chunk"], kind="stable")]   # one sort, then a slice per chunk
+        chunks = np.unique(records["chunk"])
+        starts = np.searchsorted(records["chunk"], chunks, side="left")
+        ends = np.searchsorted(records["chunk"], chunks, side="right")
+        for n, start, end in zip(chunks, starts, ends):
+            values, columns = self.chunk(int(n))
+            yield records[start:end], values, columns
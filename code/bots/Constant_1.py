@@ -0,0 +1,7 @@
+"""Reference bot: the constant 1.1 player from the assignment."""
+class Player:
+    def take_turn(self, data, victory):
+        return {k:1.1 for k in data}
+
+    def __repr__(self):
+        return "Always 1.1"
@@ -0,0 +1,9 @@
+"""Reference bot: 100 everywhere except 0 in its own column (as in client2.py)."""
+class Player:
+    def take_turn(self, data, victory):
+        d = {k:100.0 for k in data}
+        d[victory[1]] = 0.0
+        return d
+
+    def __repr__(self):
+        return "ZeroM"
@@ -0,0 +1,172 @@
+"""
+    Client library for the tournament server (sandpit.py).
+
+        from client1 import Client, sweep
+        with Client() as c:
+            print(c.command({"cmd": "PING"}))
+            replies = c.pipeline([{"cmd": "STATS"}, {"cmd": "PING"}])
+        table = sweep(script1, script2, reps=3)
+
+    A Client keeps one connection open and sends framed requests (see
+    framing.py) on it, so a run of commands costs one connect. pipeline()
+    sends up to DEPTH requests before reading replies, which the server
+    runs at once and answers in order. ClientPool spreads a list of
+    requests over several Clients in threads, for when there are more
+    than one connection's worth. sweep() plays a TEST of two scripts for
+    every pair of victory types and adds up who won.
+
+    doOne() sends a single legacy "EOM" terminated request, as the old
+    scripts (client2.py) expect.
+"""
+import json
+import socket
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import framing
+
+HOST = '128.250.106.25'
+PORT = 5002
+DEPTH = 8            # requests sent ahead of their replies, as sandpit.PIPELINE
+RETRY_WAIT = 1.0     # seconds before resending a TEST the server had no room for
+
+VICTORY_TYPES = ['Max', 'Min', 'Linear', "Quadratic", "ZeroM", "SumNeg", "SumPos"]   # as Game.victory_types
+
+def doOne(msg, host=HOST, port=PORT):
+    """Send msg (a JSON string) as a legacy request, print the reply and return it."""
+    with socket.create_connection((host, port)) as s:
+        s.sendall((msg + "EOM").encode('utf-8'))
+        reply = bytearray()
+        while True:
+            chunk = s.recv(65536)
+            if not chunk:
+                break
+            reply += chunk
+    reply = reply.decode('utf-8')
+    print(reply, end="")
+    return reply
+
+def parse_reply(reply):
+    """Split a reply into (status, value), eg ("SUCCESS", [...]) for a TEST or
+       ("ERR", "message"). value is decoded from JSON when it can be.
+    """
+    status, _, value = reply.rstrip("\n").partition(" ")
+    try:
+        value = json.loads(value)
+    except ValueError:
+        pass
+    return status, value
+
+class Client:
+    def __init__(self, host=HOST, port=PORT, compress=True, timeout=None):
+        """Connect to the server. compress - send and accept compressed frames when long."""
+        self.compress = compress
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+
+    def send(self, request):
+        """Send request (a dict) without waiting for the reply."""
+        framing.send_frame(self.sock, json.dumps(request).encode('utf-8'), self.compress)
+
+    def receive(self):
+        """The reply string of the oldest request sent and not yet received."""
+        return framing.recv_frame(self.sock).decode('utf-8')
+
+    def command(self, request):
+        """Send request (a dict) and return its reply string."""
+        self.send(request)
+        return self.receive()
+
+    def pipeline(self, requests, depth=DEPTH):
+        """Send requests (dicts) keeping up to depth unanswered, and return the replies in order."""
+        replies = []
+        sent = 0
+        for request in requests:
+            if sent - len(replies) >= depth:
+                replies.append(self.receive())
+            self.send(request)
+            sent += 1
+        while len(replies) < sent:
+            replies.append(self.receive())
+        return replies
+
+    def close(self):
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ClientPool:
+    def __init__(self, size=4, host=HOST, port=PORT, compress=True):
+        """size Clients, connected when first used."""
+        self.size = size
+        self.args = (host, port, compress)
+        self.clients = []
+
+    def map(self, requests, depth=DEPTH):
+        """Return the replies to requests (dicts), in order, pipelining them over the pool's connections."""
+        requests = list(requests)
+        n = min(self.size, len(requests))
+        while len(self.clients) < n:
+            self.clients.append(Client(*self.args))
+        parts = [requests[i::n] for i in range(n)]
+        with ThreadPoolExecutor(max_workers=max(n, 1)) as ex:
+            answers = list(ex.map(lambda c, p: c.pipeline(p, depth), self.clients[:n], parts))
+        replies = [None] * len(requests)
+        for i, a in enumerate(answers):
+            replies[i::n] = a
+        return replies
+
+    def close(self):
+        for c in self.clients:
+            c.close()
+        self.clients = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def sweep(script1, script2, reps=1, same_col=False, pool=None, syn=0):
+    """TEST script1 (as player 1) against script2 reps times for every pair of
+       victory types, running the games over pool (a ClientPool, else a new one).
+       TESTs the server has no room for are sent again after RETRY_WAIT seconds.
+       @return dictionary of
+           "vic_types": VICTORY_TYPES
+           "wins", "losses", "draws": [vt1][vt2] counts for script1
+           "errors": list of (vt1, vt2, message) of games that failed
+    """
+    n = len(VICTORY_TYPES)
+    todo = [(vt1, vt2) for vt1 in VICTORY_TYPES for vt2 in VICTORY_TYPES for _ in range(reps)]
+    table = {"vic_types": VICTORY_TYPES, "errors": []}
+    for k in ["wins", "losses", "draws"]:
+        table[k] = [[0] * n for _ in range(n)]
+
+    own_pool = pool is None
+    if own_pool:
+        pool = ClientPool()
+    try:
+        while todo:
+            requests = [{"cmd": "TEST", "syn": syn, "data": script1, "data2": script2,
+                         "vt1": vt1, "vt2": vt2, "same_col": same_col} for vt1, vt2 in todo]
+            retry = []
+            for (vt1, vt2), reply in zip(todo, pool.map(requests)):
+                status, value = parse_reply(reply)
+                i, j = VICTORY_TYPES.index(vt1), VICTORY_TYPES.index(vt2)
+                if status == "SUCCESS":
+                    winner = value[3]
+                    table["draws" if winner == 0 else "wins" if winner == 1 else "losses"][i][j] += 1
+                elif "too many TESTs" in str(value):
+                    retry.append((vt1, vt2))
+                else:
+                    table["errors"].append((vt1, vt2, value))
+            todo = retry
+            if todo:
+                time.sleep(RETRY_WAIT)
+    finally:
+        if own_pool:
+            pool.close()
+    return table
@@ -0,0 +1,138 @@
+"""
+    Victory conditions of a game kept up to date as rows are added, so
+    checking one costs O(1) at any round rather than a pass over the board.
+
+    For each column this keeps its sum (added in row order, as builtin sum
+    does) and Welford's running mean, sum of squared deviations and
+    co-deviation with the row index. Those are the numerically stable form
+    of running sums, sums of squares and cross products with the row index,
+    and give Pearson's r of the column against range(rows) for Linear.
+    Quadratic needs the same of sqrt(y - min y), which is rebuilt from the
+    column when its min changes. For most columns that happens only a few
+    times a game.
+
+    Max and Min need the unique largest (smallest) value on the whole board.
+    A count of every value is kept, with a heap each way of the values seen
+    once. A value seen twice can never be unique again, so it is dropped
+    from the top of a heap when it gets there.
+"""
+import heapq
+import numpy as np
+
+def scipy_stats():
+    """scipy.stats, imported on first use rather than with this module,
+       as importing it is most of the server's start up.
+    """
+    from scipy import stats
+    return stats
+
+class Moments:
+    """Running mean and co-deviations of (row index, value) for several columns at once."""
+
+    def __init__(self, num_cols):
+        self.n = 0
+        self.mean = np.zeros(num_cols)
+        self.m2 = np.zeros(num_cols)    # sum of squared deviations of the values
+        self.cxy = np.zeros(num_cols)   # sum of (row index - its mean) * (value - its mean)
+
+    def add(self, ys):
+        """Add the values ys of the next row, one per column."""
+        self.n += 1
+        dx = (self.n - 1) - (self.n - 2) / 2.0   # row index less the old mean row index
+        dy = ys - self.mean
+        self.mean += dy / self.n
+        dy2 = ys - self.mean
+        self.m2 += dy * dy2
+        self.cxy += dx * dy2
+
+    def rebuild(self, cols, ys):
+        """Recompute columns cols from all of their values ys (rows x len(cols)), in two passes."""
+        xm = np.arange(len(ys)) - (len(ys) - 1) / 2.0
+        mean = ys.sum(axis=0) / len(ys)
+        ym = ys - mean
+        self.mean[cols] = mean
+        self.m2[cols] = np.einsum("ij,ij->j", ym, ym)
+        self.cxy[cols] = xm @ ym
+
+    def r(self, j):
+        """Pearson's r of column j against the row index, nan if either is constant."""
+        m2x = self.n * (self.n * self.n - 1) / 12.0
+        if self.n < 2 or self.m2[j] == 0:
+            return np.nan
+        return max(-1.0, min(1.0, self.cxy[j] / np.sqrt(m2x * self.m2[j])))
+
+    def trend(self, j):
+        """True if column j rises with r > 0.9 and p < 0.05, as stats.pearsonr gives them."""
+        r = self.r(j)
+        if not r > 0.9 or self.n < 3:
+            return False
+        ab = self.n / 2.0 - 1
+        return 2 * scipy_stats().beta.cdf(-abs(r), ab, ab, loc=-1, scale=2) < 0.05
+
+class RunningConditions:
+    def __init__(self, col_names, capacity=32):
+        """Start with an empty board of columns col_names.
+           capacity - rows to allocate at first, doubled as needed.
+        """
+        self.index = {k:j for j,k in enumerate(col_names)}
+        self.col_names = list(col_names)
+        self.rows = np.zeros((capacity, len(col_names)))
+        self.n = 0
+        self.sum = [0] * len(col_names)
+        self.moments = Moments(2 * len(col_names))   # of each column y, then of its sqrt(y - low)
+        self.low = np.full(len(col_names), np.inf)
+        self.counts = {}        # value: times it is on the board
+        self.column = {}        # value: a column it is in
+        self.highs = []         # -value of each value seen once
+        self.lows = []          # value of each value seen once
+
+    def add(self, row):
+        """Add row, a sequence of floats in the order of col_names."""
+        if self.n == len(self.rows):
+            self.rows = np.concatenate([self.rows, np.zeros_like(self.rows)])
+        ys = np.asarray(row, dtype=float)
+        self.rows[self.n] = ys
+        self.n += 1
+        values = ys.tolist()
+        for j, v in enumerate(values):
+            self.sum[j] += v
+            c = self.counts.get(v, 0)
+            self.counts[v] = c + 1
+            if c == 0:
+                self.column[v] = j
+                heapq.heappush(self.highs, -v)
+                heapq.heappush(self.lows, v)
+
+        lower = ys < self.low
+        if lower.any():
+            self.low = np.minimum(self.low, ys)
+        self.moments.add(np.concatenate([ys, np.sqrt(ys - self.low)]))
+        if lower.any():
+            cols = np.flatnonzero(lower)
+            self.moments.rebuild(cols + len(ys), np.sqrt(self.rows[:self.n, cols] - self.low[cols]))
+
+    def unique(self, heap, sign):
+        """The top value of heap seen only once, or None."""
+        while heap and self.counts[sign * heap[0]] > 1:
+            heapq.heappop(heap)
+        return sign * heap[0] if heap else None
+
+    def check(self, vic_type, vic_col):
+        """True if victory type vic_type (a name in Game.victory_types) holds for
+           column vic_col on the board so far, as Game.check_condition decides it.
+        """
+        j = self.index[vic_col]
+        if vic_type in ("Max", "Min"):
+            v = self.unique(self.highs, -1) if vic_type == "Max" else self.unique(self.lows, 1)
+            return v is not None and self.column[v] == j
+        elif vic_type == "Linear":
+            return bool(self.moments.trend(j))
+        elif vic_type == "Quadratic":
+            return bool(self.moments.trend(j + len(self.col_names)))
+        elif vic_type == "ZeroM":
+            return abs(self.sum[j] / self.n) < 0.000001
+        elif vic_type == "SumNeg":
+            return self.sum[j] < 0
+        elif vic_type == "SumPos":
+            return self.sum[j] > 0
+        raise ValueError('Unknown victory type in RunningConditions.check().')
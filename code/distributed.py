@@ -0,0 +1,343 @@
+"""
+    Play tournament games on other machines.
+
+        python sandpit.py --coordinator 5003 --coordinator-host 0.0.0.0   # the server, handing out games
+        python distributed.py HOST 5003 --slots 4                         # on each worker machine
+
+    The coordinator listens on localhost unless --coordinator-host says
+    otherwise. Both ends read a shared secret from --secret (default
+    SECRET_FILE). A worker must answer a random challenge with an HMAC of
+    it under the secret before it is sent any scripts or games, and its
+    results are only accepted on that connection.
+
+    With --coordinator, run_games sends the games it chooses to a
+    RemotePool rather than a ProcessPoolExecutor. The server still owns the
+    players, score board and scheduler; workers only play games. A worker
+    plays up to --slots games at once in its own processes, exactly as
+    run_games does with --workers, and sends each result back as soon as it
+    is done.
+
+    Messages each way are JSON in frames (see framing.py). A script is sent
+    to a worker, as marshalled code, the first time it needs it. After that
+    games name scripts by hash, and a worker that has dropped one from its
+    cache asks for it again. Workers must run the same Python version as the
+    server.
+
+    A worker that closes its connection, or says nothing for WORKER_TIMEOUT
+    seconds, is dropped and its games are sent to other workers. Every game
+    has an id and its future is completed by the first result for that id,
+    so run_games records each game exactly once however many times it was
+    sent.
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import itertools
+import json
+import multiprocessing as mp
+import os
+import socket
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from threading import Condition, Lock, Thread
+
+import framing
+
+HEARTBEAT = 2          # seconds between a worker's "alive" messages
+WORKER_TIMEOUT = 10    # seconds of silence before a worker is dropped
+DRAIN_TIMEOUT = 60     # seconds shutdown() waits for games in progress
+MAX_SCRIPTS = 1024     # scripts a worker keeps
+SECRET_FILE = "coordinator.key"   # shared secret of the coordinator and its workers
+
+def send(sock, lock, msg):
+    with lock:
+        framing.send_frame(sock, json.dumps(msg).encode('utf-8'))
+
+def receive(sock):
+    return json.loads(framing.recv_frame(sock).decode('utf-8'))
+
+def code_hash(code):
+    return hashlib.sha1(code).hexdigest()
+
+def read_secret(fname):
+    """The shared secret (bytes) in file fname. Raises ValueError if it is empty."""
+    with open(fname, "rb") as f:
+        secret = f.read().strip()
+    if not secret:
+        raise ValueError("no secret in {}".format(fname))
+    return secret
+
+def answer(secret, nonce):
+    """A worker's answer to the coordinator's challenge nonce."""
+    return hmac.new(secret, "hello {}".format(nonce).encode('utf-8'), hashlib.sha256).hexdigest()
+
+class RemoteWorker:
+    """The coordinator's view of one connected worker."""
+
+    def __init__(self, sock, addr, slots):
+        self.sock = sock
+        self.addr = addr
+        self.slots = slots
+        self.games = set()   # ids of games it is playing
+        self.known = set()   # hashes of scripts it has been sent
+        self.lock = Lock()   # for sending
+        self.seen = time.time()
+
+    def __repr__(self):
+        return "worker {}:{} ({} slots)".format(self.addr[0], self.addr[1], self.slots)
+
+class RemotePool:
+    def __init__(self, host, port, secret):
+        """Listen for workers on (host, port) that know secret (bytes)."""
+        self.secret = secret
+        self.cond = Condition()
+        self.workers = set()
+        self.queue = deque()      # ids of games waiting for a worker
+        self.games = {}           # id: [future, args, hashes, worker or None]
+        self.ids = itertools.count()
+        self.closing = False
+        self.listener = socket.create_server((host, port))
+        for target in (self.accept, self.monitor):
+            Thread(target=target, daemon=True).start()
+
+    def slots(self):
+        """Games the connected workers can play at once."""
+        with self.cond:
+            return sum(w.slots for w in self.workers)
+
+    def submit(self, fn, *args):
+        """Queue sandpit.play_game(*args) for a worker; fn must be play_game.
+           @return Future of its (result, usage)
+        """
+        future = Future()
+        with self.cond:
+            game_id = next(self.ids)
+            self.games[game_id] = [future, args, [code_hash(args[0]), code_hash(args[1])], None]
+            self.queue.append(game_id)
+            sends = self.dispatch()
+        self.send_all(sends)
+        return future
+
+    def dispatch(self):
+        """Give queued games to workers with free slots. Call holding self.cond.
+           @return list of (worker, message) to send once the lock is released
+        """
+        sends = []
+        while self.queue:
+            free = [w for w in self.workers if len(w.games) < w.slots]
+            if not free:
+                break
+            w = min(free, key=lambda w: len(w.games) / w.slots)
+            game_id = self.queue.popleft()
+            entry = self.games.get(game_id)
+            if entry is None:
+                continue    # finished by a late result from a worker it was taken from
+            entry[3] = w
+            w.games.add(game_id)
+            sends.append((w, self.game_message(w, game_id)))
+        return sends
+
+    def game_message(self, w, game_id, resend=()):
+        """Message giving game_id to worker w, with the scripts it hasn't been sent (or has lost)."""
+        _, args, hashes, _ = self.games[game_id]
+        code = {}
+        for h, c in zip(hashes, args[:2]):
+            if h not in w.known or h in resend:
+                code[h] = base64.b64encode(c).decode('ascii')
+                w.known.add(h)
+        return {"type": "game", "id": game_id, "args": hashes + list(args[2:]), "code": code}
+
+    def send_all(self, sends):
+        for w, msg in sends:
+            try:
+                send(w.sock, w.lock, msg)
+            except OSError as msg:
+                print("Lost {}: {}".format(w, msg))
+                self.lost(w)
+
+    def accept(self):
+        """Thread: accept workers until shutdown."""
+        while not self.closing:
+            try:
+                sock, addr = self.listener.accept()
+            except OSError:
+                return
+            Thread(target=self.serve, args=(sock, addr), daemon=True).start()
+
+    def serve(self, sock, addr):
+        """Thread: check one worker knows the secret, then read its messages until it goes."""
+        try:
+            sock.settimeout(WORKER_TIMEOUT)
+            nonce = os.urandom(16).hex()
+            send(sock, Lock(), {"type": "challenge", "nonce": nonce})
+            hello = receive(sock)
+            if not hmac.compare_digest(str(hello.get("answer", "")), answer(self.secret, nonce)):
+                raise ValueError("wrong answer to challenge")
+            sock.settimeout(None)
+            w = RemoteWorker(sock, addr, max(1, int(hello.get("slots", 1))))
+        except Exception as msg:
+            print("Bad worker hello from {}: {}".format(addr, msg))
+            sock.close()
+            return
+        with self.cond:
+            self.workers.add(w)
+            sends = self.dispatch()
+        print("Joined: {}".format(w))
+        self.send_all(sends)
+
+        try:
+            while True:
+                msg = receive(sock)
+                w.seen = time.time()
+                if msg["type"] in ("result", "error"):
+                    self.finish(w, msg)
+                elif msg["type"] == "missing":
+                    with self.cond:
+                        w.known.difference_update(msg["hashes"])
+                        sends = [(w, self.game_message(w, msg["id"], msg["hashes"]))] if msg["id"] in w.games else []
+                    self.send_all(sends)
+        except Exception as msg:
+            if not self.closing:
+                print("Lost {}: {}".format(w, msg))
+        self.lost(w)
+
+    def finish(self, w, msg):
+        """Complete the future of a game a worker finished, unless it already has been."""
+        with self.cond:
+            w.games.discard(msg["id"])
+            entry = self.games.pop(msg["id"], None)
+            if entry is not None and entry[3] is None:
+                self.queue.remove(msg["id"])   # lost() had queued it again
+            elif entry is not None and entry[3] is not w:
+                entry[3].games.discard(msg["id"])
+            sends = self.dispatch()
+            self.cond.notify_all()
+        if entry is not None:
+            if msg["type"] == "result":
+                entry[0].set_result(tuple(msg["outcome"]))
+            else:
+                entry[0].set_exception(RuntimeError("{} failed: {}".format(w, msg["message"])))
+        self.send_all(sends)
+
+    def lost(self, w):
+        """Drop worker w and send its games to other workers."""
+        with self.cond:
+            if w not in self.workers:
+                return
+            self.workers.discard(w)
+            for game_id in sorted(w.games, reverse=True):
+                if game_id in self.games:
+                    self.games[game_id][3] = None
+                    self.queue.appendleft(game_id)
+            w.games.clear()
+            sends = self.dispatch()
+        try:
+            w.sock.close()
+        except OSError:
+            pass
+        self.send_all(sends)
+
+    def monitor(self):
+        """Thread: drop workers that have gone quiet."""
+        while not self.closing:
+            time.sleep(HEARTBEAT)
+            with self.cond:
+                quiet = [w for w in self.workers if time.time() - w.seen > WORKER_TIMEOUT]
+            for w in quiet:
+                print("Lost {}: silent for {}s".format(w, WORKER_TIMEOUT))
+                self.lost(w)
+
+    def shutdown(self, wait=True):
+        """Stop, first waiting up to DRAIN_TIMEOUT seconds for games in progress if wait.
+           Games not played by then fail with RuntimeError.
+        """
+        with self.cond:
+            if wait:
+                self.cond.wait_for(lambda: not self.games, DRAIN_TIMEOUT)
+            self.closing = True
+            left = list(self.games.values())
+            self.games = {}
+            self.queue.clear()
+            workers = list(self.workers)
+        for entry in left:
+            entry[0].set_exception(RuntimeError("game not played before shutdown"))
+        for w in workers:
+            try:
+                send(w.sock, w.lock, {"type": "bye"})
+                w.sock.close()
+            except OSError:
+                pass
+        self.listener.close()
+
+def work(host, port, secret, slots=1):
+    """Be a worker for the coordinator at (host, port), which shares secret (bytes), 
+       playing up to slots games at once, until it says bye or goes away.
+    """
+    import sandpit   # here, as the server imports this module
+
+    sock = socket.create_connection((host, port))
+    lock = Lock()
+    challenge = receive(sock)
+    send(sock, lock, {"type": "hello", "slots": slots, "answer": answer(secret, challenge["nonce"])})
+    print("Connected to {}:{} with {} slots".format(host, port, slots))
+        # forkserver, so game processes don't hold sock open if this process dies
+    pool = ProcessPoolExecutor(max_workers=slots, initializer=sandpit.ignore_sigint,
+                               mp_context=mp.get_context("forkserver"))
+    scripts = OrderedDict()   # hash: marshalled code, least recently used first
+    done = []
+
+    def heartbeat():
+        while not done:
+            time.sleep(HEARTBEAT)
+            try:
+                send(sock, lock, {"type": "alive"})
+            except OSError:
+                return
+
+    def reply(game_id, future):
+        try:
+            msg = {"type": "result", "id": game_id, "outcome": future.result()}
+        except Exception as e:
+            msg = {"type": "error", "id": game_id, "message": str(e)}
+        try:
+            send(sock, lock, msg)
+        except OSError as e:
+            print("Couldn't send result of game {}: {}".format(game_id, e))
+
+    Thread(target=heartbeat, daemon=True).start()
+    try:
+        while True:
+            msg = receive(sock)
+            if msg["type"] == "bye":
+                break
+            for h, c in msg["code"].items():
+                scripts[h] = base64.b64decode(c)
+            hashes = msg["args"][:2]
+            missing = [h for h in hashes if h not in scripts]
+            if missing:
+                send(sock, lock, {"type": "missing", "id": msg["id"], "hashes": missing})
+                continue
+            for h in hashes:
+                scripts.move_to_end(h)
+            while len(scripts) > MAX_SCRIPTS:
+                scripts.popitem(last=False)
+            future = pool.submit(sandpit.play_game, *([scripts[h] for h in hashes] + msg["args"][2:]))
+            future.add_done_callback(lambda f, game_id=msg["id"]: reply(game_id, f))
+    except (OSError, framing.FrameError) as msg:
+        print("Coordinator went away: {}".format(msg))
+    finally:
+        done.append(True)
+        pool.shutdown(wait=True)
+        sock.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Play games for a tournament server started with --coordinator.")
+    parser.add_argument("host", help="coordinator host")
+    parser.add_argument("port", type=int, help="coordinator port (its --coordinator)")
+    parser.add_argument("--slots", type=int, default=1, help="games played at once (default 1)")
+    parser.add_argument("--secret", default=SECRET_FILE, 
+                        help="file of the secret shared with the coordinator (default {})".format(SECRET_FILE))
+    args = parser.parse_args()
+    work(args.host, args.port, read_secret(args.secret), args.slots)
@@ -0,0 +1,123 @@
+"""
+    Length prefixed framing of requests and replies, so a message of any
+    size (or content) is read in one pass without searching it for an end.
+
+    A frame is a 10 byte header then the payload:
+        MAGIC    4 bytes, b"\\x00SP1", which no JSON text starts with
+        flags    1 byte, COMPRESSED if the payload is zlib compressed,
+                 ACCEPT_COMPRESSED (requests only) if the reply may be
+        unused   1 byte, 0
+        length   4 bytes, big endian, of the payload as sent
+
+    A request that does not start with MAGIC is a legacy one terminated by
+    "EOM", as sent by client2.py, and gets a legacy reply. Framed requests
+    get framed replies, compressed when the client accepts it and the reply
+    is longer than COMPRESS_MIN bytes.
+"""
+import asyncio
+import struct
+import zlib
+
+MAGIC = b"\x00SP1"
+HEADER = struct.Struct(">4sBxI")
+EOM = b"EOM"
+
+COMPRESSED = 1
+ACCEPT_COMPRESSED = 2
+
+COMPRESS_MIN = 4096   # payloads shorter than this are never compressed
+COMPRESS_LEVEL = 6
+
+class FrameError(Exception):
+    pass
+
+def encode(payload, flags=0, compress=False):
+    """Return the frame of bytes payload. If compress and payload is long
+       enough to be worth it, it is compressed and COMPRESSED set in flags.
+    """
+    if compress and len(payload) >= COMPRESS_MIN:
+        payload = zlib.compress(payload, COMPRESS_LEVEL)
+        flags |= COMPRESSED
+    else:
+        flags &= ~COMPRESSED
+    return HEADER.pack(MAGIC, flags, len(payload)) + payload
+
+def parse_header(header, max_size):
+    """Return (flags, length) of a frame header, or raise FrameError."""
+    magic, flags, length = HEADER.unpack(header)
+    if magic != MAGIC:
+        raise FrameError("bad frame header")
+    if length > max_size:
+        raise FrameError("message longer than {} bytes".format(max_size))
+    return flags, length
+
+def decode(payload, flags, max_size):
+    """Return the bytes of a received payload, decompressing it if COMPRESSED,
+       to at most max_size bytes.
+    """
+    if not flags & COMPRESSED:
+        return bytes(payload)
+    d = zlib.decompressobj()
+    try:
+        data = d.decompress(payload, max_size)
+    except zlib.error as msg:
+        raise FrameError("bad compressed payload: {}".format(msg))
+    if d.unconsumed_tail:
+        raise FrameError("message longer than {} bytes".format(max_size))
+    return data
+
+async def read_message(reader, max_size, chunk_size=65536):
+    """Read one request from asyncio StreamReader reader, framed or "EOM" terminated.
+       Reads nothing past a framed request, so more can follow on the connection.
+       @return (payload bytes, flags), where flags is None for a legacy request,
+               or (None, None) if the connection closed before a request started.
+       Raises FrameError if the request is too long or malformed, and
+       asyncio.IncompleteReadError if the connection closes part way through.
+    """
+    first = await reader.read(1)
+    if not first:
+        return (None, None)
+
+    if first == MAGIC[:1]:
+        header = first + await reader.readexactly(HEADER.size - 1)
+        flags, length = parse_header(header, max_size)
+        return (decode(await reader.readexactly(length), flags, max_size), flags)
+
+    data = bytearray(first)
+    while not data.endswith(EOM):
+        chunk = await reader.read(chunk_size)
+        if not chunk:
+            raise asyncio.IncompleteReadError(bytes(data), None)
+        data += chunk
+        if len(data) > max_size:
+            raise FrameError("message longer than {} bytes".format(max_size))
+    return (bytes(data[:-len(EOM)]), None)
+
+def reply(msg, flags):
+    """Bytes to send for reply msg to a request with flags from read_message."""
+    if flags is None:
+        return msg
+    return encode(msg, compress=bool(flags & ACCEPT_COMPRESSED))
+
+def send_frame(sock, payload, compress=True):
+    """Send bytes payload as a framed request on blocking socket sock,
+       compressed if long enough, accepting a compressed reply if compress.
+    """
+    sock.sendall(encode(payload, ACCEPT_COMPRESSED if compress else 0, compress))
+
+def recv_exactly(sock, n):
+    """Read exactly n bytes from blocking socket sock into one buffer."""
+    buf = bytearray(n)
+    view = memoryview(buf)
+    got = 0
+    while got < n:
+        r = sock.recv_into(view[got:])
+        if r == 0:
+            raise FrameError("connection closed after {} of {} bytes".format(got, n))
+        got += r
+    return buf
+
+def recv_frame(sock, max_size=2**31 - 1):
+    """Read one framed reply from blocking socket sock and return its payload bytes."""
+    flags, length = parse_header(recv_exactly(sock, HEADER.size), max_size)
+    return decode(recv_exactly(sock, length), flags, max_size)
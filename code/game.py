@@ -5,11 +5,12 @@
     Fri 30 Mar 2018 15:02:55 AEDT
 """
 import random
-from scipy import stats 
 import numpy as np
 from collections import defaultdict
 import threading
 from datetime import datetime
+import time
+from conditions import RunningConditions, scipy_stats
 
 class Game:
     names = set([ "Amy", "Andrew", "Angela", "Bernie", "Biying", "Bushra",
@@ -29,35 +30,51 @@ class Game:
     victory_types = ['Max', 'Min', 'Linear', "Quadratic", "ZeroM", "SumNeg", "SumPos"]
 
     TIME = 10   # seconds for one turn
+    GAME_TIME = 60   # seconds one player may spend in take_turn over a whole game
+    NUM_ROUNDS = 10  # rounds in a game, each player taking one turn a round
 
-    def __init__(self, num_rounds=10, num_cols=5, vic_type1=None, vic_type2=None, same_col=False):
+    def __init__(self, num_rounds=NUM_ROUNDS, num_cols=5, vic_type1=None, vic_type2=None, same_col=False, seed=None):
         """ Randomly choose num_cols column names and the two 
             victory conditions for the game (if vic_type == None).
 
             vic_type - an index into Game.victory_types to fix criteria for the game.
                        If None, randomly chosen.
             same_col - if True, then choose the same victory column for both players, else random.
+            seed     - seed for the random choices, so the same seed and arguments give the
+                       same game. If None, one is drawn from the random module.
         """
         self.num_rounds = num_rounds
         self.num_cols = num_cols
-        self.col_names = random.sample(Game.names, k=num_cols)
+        self.seed = random.randrange(2**32) if seed is None else seed
+        rng = random.Random(self.seed)
+        self.col_names = rng.sample(sorted(Game.names), k=num_cols)
 
-            # select two victory types and columns
-        if vic_type1 is None:
-            self.vic_types = [random.sample(Game.victory_types)]
-        else:
-            self.vic_types = [Game.victory_types[vic_type1]]
-
-        if vic_type2 is None:
-            self.vic_types.append(random.sample(Game.victory_types))
-        else:
-            self.vic_types.append(Game.victory_types[vic_type2])
+            # select two victory types and columns, drawing both types even if
+            # given so the columns of a seed don't depend on vic_type1 and vic_type2
+        self.vic_types = [rng.choice(Game.victory_types), rng.choice(Game.victory_types)]
+        if vic_type1 is not None:
+            self.vic_types[0] = Game.victory_types[vic_type1]
+        if vic_type2 is not None:
+            self.vic_types[1] = Game.victory_types[vic_type2]
 
         if same_col:
-            c = random.sample(self.col_names, k=1)[0]
+            c = rng.sample(self.col_names, k=1)[0]
             self.vic_cols = [c,c]
         else:
-            self.vic_cols = random.sample(self.col_names, k=2)
+            self.vic_cols = rng.sample(self.col_names, k=2)
+
+            # filled in by run_game: seconds spent in each part, and each player's turns
+        self.timings = {"take_turn": 0.0, "validate": 0.0, "check_condition": 0.0}
+        self.turn_times = ([], [])
+        self.timed_out = None   # (player number, seconds its turn was allowed) if a turn ran out of time
+        self.conditions = RunningConditions(self.col_names)   # of the board so far
+
+    def standing(self):
+        """[p1's victory condition holds, p2's holds] on the board so far, in O(1).
+           Call it from the thread running run_game, or after it, as checking
+           tidies the heaps that adding rows pushes to, with no lock.
+        """
+        return [self.conditions.check(self.vic_types[i], self.vic_cols[i]) for i in range(2)]
 
     def check_condition(self, data, player_index):
         """Return True if vic_*[player_index] is true for data, False otherwise.
@@ -90,12 +107,12 @@ class Game:
             return len(mins) == 1 and self.vic_cols[player_index] == mins[0]
         elif self.vic_types[player_index] == "Linear":
             ys = data[self.vic_cols[player_index]]
-            r,p = stats.pearsonr(range(len(ys)), ys)
+            r,p = scipy_stats().pearsonr(range(len(ys)), ys)
             return p < 0.05 and r > 0.9
         elif self.vic_types[player_index] == "Quadratic":
             ys = data[self.vic_cols[player_index]]
             ys = np.sqrt(ys - np.min(ys))
-            r,p = stats.pearsonr(range(len(ys)), ys)
+            r,p = scipy_stats().pearsonr(range(len(ys)), ys)
             return p < 0.05 and r > 0.9
         elif self.vic_types[player_index] == "ZeroM":
             return abs(np.mean(data[self.vic_cols[player_index]])) < 0.000001
@@ -106,6 +123,103 @@ class Game:
         else:
             raise ValueError('Unknown victory type in Game.check_condition().')
 
+    @staticmethod
+    def check_condition_batch(boards, vic_types, vic_cols):
+        """Vectorised check_condition for many finished games at once.
+           boards    : array of shape (games, columns, rows), eg from Game.stack_boards()
+           vic_types : victory type name (or index into Game.victory_types) for each game,
+                       or a single one for all games
+           vic_cols  : index of the victory column in each game's board, or a single one
+           Return array of bools, True where that game's victory condition is met.
+        """
+        boards = np.asarray(boards, dtype=float)
+        num_games, _, num_rows = boards.shape
+        vic_types = np.broadcast_to(np.asarray(vic_types), (num_games,))
+        if vic_types.dtype.kind in "iu":
+            vic_types = np.array(Game.victory_types)[vic_types]
+        vic_cols = np.broadcast_to(np.asarray(vic_cols, dtype=int), (num_games,))
+
+        unknown = set(vic_types) - set(Game.victory_types)
+        if unknown:
+            raise ValueError('Unknown victory type {} in Game.check_condition_batch().'.format(unknown))
+
+        games = np.arange(num_games)
+        cols = boards[games, vic_cols, :]   # (games, rows) of each game's victory column
+        wins = np.zeros(num_games, dtype=bool)
+
+        for vt in ("Max", "Min"):
+            g = vic_types == vt
+            if not g.any():
+                continue
+                # a value is unique if it differs from both neighbours once sorted
+            vals = np.sort(boards[g].reshape(g.sum(), -1), axis=1)
+            unique = np.ones(vals.shape, dtype=bool)
+            unique[:, 1:] &= vals[:, 1:] != vals[:, :-1]
+            unique[:, :-1] &= vals[:, :-1] != vals[:, 1:]
+            if vt == "Max":
+                i = vals.shape[1] - 1 - np.argmax(unique[:, ::-1], axis=1)
+            else:
+                i = np.argmax(unique, axis=1)
+            best = vals[np.arange(len(i)), i]
+            wins[g] = unique.any(axis=1) & (cols[g] == best[:, None]).any(axis=1)
+
+        for vt in ("Linear", "Quadratic"):
+            g = vic_types == vt
+            if not g.any():
+                continue
+            ys = cols[g]
+            if vt == "Quadratic":
+                ys = np.sqrt(ys - ys.min(axis=1, keepdims=True))
+            r, p = Game.pearsonr_batch(ys)
+            with np.errstate(invalid="ignore"):
+                wins[g] = (p < 0.05) & (r > 0.9)
+
+        g = vic_types == "ZeroM"
+        wins[g] = np.abs(np.mean(cols[g], axis=1)) < 0.000001
+
+            # cumsum adds left to right, exactly as builtin sum does
+        sums = np.cumsum(cols, axis=1)[:, -1] if num_rows > 0 else np.zeros(num_games)
+        g = vic_types == "SumNeg"
+        wins[g] = sums[g] < 0
+        g = vic_types == "SumPos"
+        wins[g] = sums[g] > 0
+
+        return wins
+
+    @staticmethod
+    def pearsonr_batch(ys):
+        """Pearson r and two sided p of each row of ys against range(len(row)),
+           computed as stats.pearsonr does. Constant rows give nan.
+        """
+        stats = scipy_stats()
+        n = ys.shape[1]
+        xm = np.arange(n) - (n - 1) / 2.0
+        ym = ys - ys.mean(axis=1, keepdims=True)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            r = (ym / np.linalg.norm(ym, axis=1, keepdims=True)) @ (xm / np.linalg.norm(xm))
+            r = np.clip(r, -1.0, 1.0)
+            ab = n / 2.0 - 1
+            p = 2 * stats.beta.cdf(-np.abs(r), ab, ab, loc=-1, scale=2)
+        return r, p
+
+    @staticmethod
+    def stack_boards(results):
+        """Stack the boards of finished Game.run_game results for check_condition_batch.
+           Return (boards, vic types, vic col indices) where boards has shape
+           (games, columns, rows) and the other two have shape (2, games),
+           one row for each player.
+        """
+        boards = []
+        vic_types = [[], []]
+        vic_cols = [[], []]
+        for result in results:
+            names = list(result[0])
+            boards.append([result[0][k] for k in names])
+            for i in range(2):
+                vic_types[i].append(result[i + 1][1])
+                vic_cols[i].append(names.index(result[i + 1][2]))
+        return np.array(boards, dtype=float), np.array(vic_types), np.array(vic_cols, dtype=int)
+
     def timeout(func, args=(), kwargs={}, duration=TIME, default=None):
         '''This function will spwan a thread and run the given function using the args, kwargs and 
         Taken from: http://code.activestate.com/recipes/473878/
@@ -140,48 +254,100 @@ class Game:
         else:
             return it.result
 
-    def run_game(self, p1, p2):
+    def turn(player, data, victory, duration=TIME):
+        """Return player.take_turn(data, victory) as for Game.timeout.
+           Players that enforce their own time limit (eg sandbox.SandboxedPlayer) 
+           are called directly rather than in a thread.
+        """
+        if hasattr(player, "take_turn_timeout"):
+            return player.take_turn_timeout(data, victory, duration)
+        return Game.timeout(player.take_turn, (data, victory), duration=duration)
+
+    def timeout_message(player_number, turn_limit, time_left):
+        """Why player_number (1 or 2) timed out."""
+        if time_left <= 0:
+            return "Player {} timed out: used all its time for the game".format(player_number)
+        return "Player {} timed out: turn took more than {:.1f}s".format(player_number, turn_limit)
+
+    def run_game(self, p1, p2, turn_limits=(TIME, TIME), game_time=GAME_TIME):
         """Run a game of p1 vs p2.
-           Return lots of stuff... 0 for draw, or 1 or 2 for winner.
+           Return lots of stuff... [board, p1 (name, victory type, column), 
+           p2 (ditto), winner, "gg", self.seed] where winner is 0 for draw, or 1 or 2.
+           The seed comes last so the other fields keep the places they always had.
 
            If one of the player's take_turn fails, return tuple of
-           (player number, exception message)  (not list of 5 things)
+           (player number, exception message)  (not list of 6 things)
+
+           The board is one preallocated array, row 0 all zeros and one row 
+           added by each player each round. Players are given a dictionary of 
+           lists of its columns so far, as in the spec, which are copies so 
+           they cannot alter it.
+
+           turn_limits - seconds allowed for one turn of p1 and of p2
+           game_time   - seconds each player may spend over all its turns. A turn is
+                         allowed whichever is less of its limit and what is left of this.
+
+           Each row is added to self.conditions as well, which decides the winner.
+
+           Time taken is added to self.timings and self.turn_times, and
+           self.timed_out is set if a player fails by running out of time.
         """
         could_win = [True, True]  # can each player win?
-        data = {k:[0.0] for k in self.col_names}
+        board = np.zeros((2 * self.num_rounds + 1, self.num_cols), order="F")
+        self.conditions = RunningConditions(self.col_names, capacity=len(board))
+        self.conditions.add(board[0])
+        num_rows = 1
+        time_left = [game_time, game_time]
         for rnd in range(self.num_rounds):
-            before = data.copy()
-            p1_row = Game.timeout(p1.take_turn, (data, (self.vic_types[0], self.vic_cols[0])))
+            data = {k:board[:num_rows, j].tolist() for j,k in enumerate(self.col_names)}
+            start = time.perf_counter()
+            limit = min(turn_limits[0], time_left[0])
+            p1_row = Game.turn(p1, data, (self.vic_types[0], self.vic_cols[0]), limit)
+            self.turn_times[0].append(time.perf_counter() - start)
+            time_left[0] -= self.turn_times[0][-1]
             if p1_row is None:
-                return (1, "Player 1 timed out")
+                self.timed_out = (1, limit)
+                return (1, Game.timeout_message(1, turn_limits[0], time_left[0]))
             elif isinstance(p1_row, Exception):
                 return (1, p1_row)
-            if data != before:
-                return (1, "Player 1 altered previous rows in data on their turn.")
 
-            before = data.copy()
-            p2_row = Game.timeout(p2.take_turn, (data, (self.vic_types[1], self.vic_cols[1])))
+            data = {k:board[:num_rows, j].tolist() for j,k in enumerate(self.col_names)}
+            start = time.perf_counter()
+            limit = min(turn_limits[1], time_left[1])
+            p2_row = Game.turn(p2, data, (self.vic_types[1], self.vic_cols[1]), limit)
+            self.turn_times[1].append(time.perf_counter() - start)
+            time_left[1] -= self.turn_times[1][-1]
+            self.timings["take_turn"] += self.turn_times[0][-1] + self.turn_times[1][-1]
             if p2_row is None:
-                return (2, "Player 2 timed out")
+                self.timed_out = (2, limit)
+                return (2, Game.timeout_message(2, turn_limits[1], time_left[1]))
             elif isinstance(p2_row, Exception):
                 return (2, p2_row)
-            if data != before:
-                return (2, "Player 2 altered previous rows in data on their turn.")
 
                 # append each row, looking for missing key or non-float value
+            start = time.perf_counter()
             for p,row in [(0, p1_row), (1, p2_row)]:
-                for k in data:
+                for k in self.col_names:
                     if k not in row or not isinstance(row[k], float):
                         could_win[p] = False
                         return((p+1, "Player {} returned a row that was not valid (bad key or not float value).\n".format(p+1)))
                     elif row[k] > 1023 or row[k] < -1023:
                         could_win[p] = False
                         return((p+1, "Player {} returned a row that had a number out of range.\n".format(p+1)))
-                    else:
-                        data[k].append(round(row[k],5))
+                board[num_rows] = [round(row[k], 5) for k in self.col_names]   # as builtin round, not np.round
+                num_rows += 1
+            self.timings["validate"] += time.perf_counter() - start
+
+            start = time.perf_counter()
+            self.conditions.add(board[num_rows - 2])
+            self.conditions.add(board[num_rows - 1])
+            self.timings["check_condition"] += time.perf_counter() - start
 
+        data = {k:board[:, j] for j,k in enumerate(self.col_names)}
         if all(could_win):
-            wins = [self.check_condition(data, i) for i in range(2)]
+            start = time.perf_counter()
+            wins = self.standing()
+            self.timings["check_condition"] += time.perf_counter() - start
             if all(wins) or not any(wins):
                 winner = 0
             elif wins[0]:
@@ -193,9 +359,10 @@ class Game:
         else:
             winner = 2
 
-        return [data, 
+        return [{k:v.tolist() for k,v in data.items()}, 
                 (str(p1), self.vic_types[0], self.vic_cols[0]), 
                 (str(p2), self.vic_types[1], self.vic_cols[1]), 
                 winner,
-                "gg"
+                "gg",
+                self.seed
                ]
@@ -0,0 +1,143 @@
+"""
+    A bounded queue of jobs (TEST games) run by a fixed number of worker threads,
+    so TEST traffic can only ever use that many game slots.
+
+    Jobs are run in order of how many jobs their owner (syndicate) already
+    has queued, then arrival, so one syndicate firing off hundreds of TESTs
+    cannot hold up everyone else. Results are kept for the max_results most
+    recently finished jobs.
+
+    A job may play more than one game at once by borrowing the game slots
+    of idle workers with lend(), which stops those workers taking jobs
+    until give_back(), so games never exceed num_workers.
+
+    submit() also hands back a concurrent.futures.Future of the job's result,
+    so a caller can wait for it (eg with asyncio.wrap_future) without
+    holding a thread.
+"""
+import heapq
+import itertools
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from threading import Condition, Thread
+
+QUEUED = "QUEUED"
+RUNNING = "RUNNING"
+DONE = "DONE"
+UNKNOWN = "UNKNOWN"
+
+class JobQueue:
+    def __init__(self, num_workers=2, max_queued=100, max_results=1000):
+        self.max_queued = max_queued
+        self.max_results = max_results
+        self.cond = Condition()
+        self.heap = []                 # (priority, arrival, job id)
+        self.queued = {}               # job id: (func, args, owner)
+        self.running = set()
+        self.results = OrderedDict()   # job id: result, oldest first
+        self.futures = {}              # job id: Future, of jobs queued, running or in results
+        self.owner_counts = {}         # owner: number of jobs queued
+        self.order = itertools.count()
+        self.free = num_workers        # game slots not used by a job or lent
+        self.stopping = False
+        self.workers = [Thread(target=self.work, daemon=True) for _ in range(num_workers)]
+        for w in self.workers:
+            w.start()
+
+    def submit(self, func, args=(), owner=None):
+        """Queue func(*args) and return (its job id, a Future of its result),
+           or None if the queue is full.
+        """
+        with self.cond:
+            if len(self.queued) >= self.max_queued or self.stopping:
+                return None
+            job_id = uuid.uuid4().hex
+            n = self.owner_counts.get(owner, 0)
+            self.owner_counts[owner] = n + 1
+            heapq.heappush(self.heap, (n, next(self.order), job_id))
+            self.queued[job_id] = (func, args, owner)
+            self.futures[job_id] = Future()
+            self.cond.notify_all()
+            return (job_id, self.futures[job_id])
+
+    def future(self, job_id):
+        """The Future of job_id's result, as from submit(), or None if it is unknown."""
+        with self.cond:
+            return self.futures.get(job_id)
+
+    def status(self, job_id):
+        """Return (state, value): (QUEUED, jobs ahead of it), (RUNNING, None),
+           (DONE, result of func) or (UNKNOWN, None).
+        """
+        with self.cond:
+            return self._status(job_id)
+
+    def _status(self, job_id):
+        if job_id in self.results:
+            return (DONE, self.results[job_id])
+        if job_id in self.running:
+            return (RUNNING, None)
+        if job_id in self.queued:
+            ahead = sum(1 for e in self.heap if e < self.entry(job_id))
+            return (QUEUED, ahead)
+        return (UNKNOWN, None)
+
+    def entry(self, job_id):
+        return next(e for e in self.heap if e[2] == job_id)
+
+    def work(self):
+        """Worker thread: run queued jobs until shutdown()."""
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: (self.heap and self.free > 0) or self.stopping)
+                if self.stopping:
+                    return
+                self.free -= 1
+                _, _, job_id = heapq.heappop(self.heap)
+                func, args, owner = self.queued.pop(job_id)
+                self.owner_counts[owner] -= 1
+                if self.owner_counts[owner] == 0:
+                    del self.owner_counts[owner]
+                self.running.add(job_id)
+                future = self.futures[job_id]
+            future.set_running_or_notify_cancel()
+
+            try:
+                result = func(*args)
+            except Exception as msg:
+                result = msg
+
+            with self.cond:
+                self.free += 1
+                self.running.discard(job_id)
+                self.results[job_id] = result
+                while len(self.results) > self.max_results:
+                    del self.futures[self.results.popitem(last=False)[0]]
+                self.cond.notify_all()
+            future.set_result(result)
+
+    def lend(self, n):
+        """Take up to n free game slots for a running job's extra games.
+           @return number taken, to be handed back with give_back()
+        """
+        with self.cond:
+            n = max(0, min(n, self.free))
+            self.free -= n
+            return n
+
+    def give_back(self, n):
+        """Return n game slots taken with lend()."""
+        with self.cond:
+            self.free += n
+            self.cond.notify_all()
+
+    def shutdown(self):
+        """Stop taking jobs; workers exit after their current job.
+           Futures of jobs still queued are cancelled.
+        """
+        with self.cond:
+            self.stopping = True
+            for job_id in self.queued:
+                self.futures[job_id].cancel()
+            self.cond.notify_all()
@@ -0,0 +1,68 @@
+"""
+    Save and delete player scripts on disk in a background thread, so ADD
+    and DEL only change the players registry in memory and return.
+
+    The registry is the source of truth; the files in SDIR are only
+    for restarting the server. Jobs run in the order they were queued, so
+    an ADD, DEL and ADD again of a player leave the right file behind. A
+    script is written to a temporary file, formatted with yapf, then
+    renamed over its name, so a crash never leaves a half written script
+    for the next start to load.
+"""
+import os
+import queue
+import shutil
+from threading import Thread
+
+YAPF_LINES = 100000   # yapf formats lines 1 to this, ie the whole script
+
+class Persister:
+    def __init__(self):
+        self.jobs = queue.Queue()
+        self.thread = Thread(target=self.work, daemon=True)
+        self.thread.start()
+
+    def save(self, fname, text):
+        """Queue writing text to fname, formatted with yapf if it can be."""
+        self.jobs.put((self.write, (fname, text)))
+
+    def delete(self, fname, backup_dir):
+        """Queue moving fname into backup_dir."""
+        self.jobs.put((self.move, (fname, backup_dir)))
+
+    def write(self, fname, text):
+        tmp = fname + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(text)
+        try:
+            import yapf   # here, so it is only loaded once a script is saved
+            yapf.FormatFiles([tmp], [(1, YAPF_LINES)], in_place=True)
+        except Exception:
+            print("Cannot yapf {}\n".format(fname))
+        os.replace(tmp, fname)
+
+    def move(self, fname, backup_dir):
+        print("Moved: {} to {}".format(fname, shutil.move(fname, os.path.join(backup_dir, os.path.basename(fname)))))
+
+    def work(self):
+        """Background thread: run jobs until a None job."""
+        while True:
+            job = self.jobs.get()
+            try:
+                if job is None:
+                    return
+                func, args = job
+                func(*args)
+            except Exception as msg:
+                print("Couldn't {} {}: {}".format(func.__name__, args[0], msg))
+            finally:
+                self.jobs.task_done()
+
+    def flush(self):
+        """Wait until every job queued so far is done."""
+        self.jobs.join()
+
+    def close(self):
+        """Finish the queued jobs and stop the thread."""
+        self.jobs.put(None)
+        self.thread.join()
@@ -0,0 +1,118 @@
+"""
+    A cache of compiled player scripts, so run_games compiles each
+    script once rather than exec'ing its source every game.
+
+    Entries are keyed on (name, syn, hash of code), so a player that is
+    deleted and added again with new code never gets the old code object.
+
+    With a directory, compiled scripts are also kept on disk as marshalled
+    code, named by a hash of the Python bytecode version, file name and
+    script, so a restarted server doesn't compile them again. prune()
+    deletes the files not used since the cache was made.
+"""
+import hashlib
+import importlib.util
+import marshal
+import os
+from collections import OrderedDict
+from threading import Lock
+
+class PlayerCache:
+    def __init__(self, max_size=512, directory=None):
+        """max_size - number of compiled scripts kept, least recently used dropped first.
+           directory - if not None, where compiled scripts are kept across restarts.
+        """
+        self.max_size = max_size
+        self.directory = directory
+        self.used = set()     # files in directory got or written
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+        self.entries = OrderedDict()  # (name, syn, hash): [code object, marshalled bytes or None]
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, code, marshalled=False):
+        """Return the compiled code object for player key = (name, syn) with script code.
+           If marshalled is True return it as bytes from marshal.dumps, ready to
+           send to a worker process.
+           Raises SyntaxError etc if code does not compile.
+        """
+        k = (key[0], key[1], hashlib.sha1(code.encode('utf-8')).hexdigest())
+        with self.lock:
+            entry = self.entries.get(k)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.entries.move_to_end(k)
+
+        if entry is None:
+            entry = self.compile(code, "{}_{}.py".format(key[0], key[1]))
+            with self.lock:
+                self.entries[k] = entry
+                while len(self.entries) > self.max_size:
+                    self.entries.popitem(last=False)
+
+        if not marshalled:
+            return entry[0]
+        if entry[1] is None:
+            entry[1] = marshal.dumps(entry[0])
+        return entry[1]
+
+    def compile(self, code, fname):
+        """[code object, marshalled bytes or None] of code, from the directory if it is there."""
+        if self.directory is None:
+            return [compile(code, fname, "exec"), None]
+        h = hashlib.sha1(importlib.util.MAGIC_NUMBER + fname.encode('utf-8') + b"\0" + code.encode('utf-8'))
+        path = os.path.join(self.directory, h.hexdigest() + ".bin")
+        with self.lock:
+            self.used.add(path)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            return [marshal.loads(data), data]
+        except (OSError, ValueError, EOFError, TypeError):
+            pass
+        compiled = compile(code, fname, "exec")
+        data = marshal.dumps(compiled)
+        try:
+            tmp = "{}.{}.tmp".format(path, os.getpid())
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+        except OSError as msg:
+            print("Couldn't cache {}: {}".format(fname, msg))
+        return [compiled, data]
+
+    def prune(self):
+        """Delete the files in the directory not got or written since the cache was made.
+           @return number deleted
+        """
+        if self.directory is None:
+            return 0
+        n = 0
+        for file in os.listdir(self.directory):
+            path = os.path.join(self.directory, file)
+            if path not in self.used:
+                try:
+                    os.remove(path)
+                    n += 1
+                except OSError:
+                    pass
+        return n
+
+    def invalidate(self, key):
+        """Forget all compiled versions of player key = (name, syn)."""
+        with self.lock:
+            for k in [k for k in self.entries if k[:2] == tuple(key)]:
+                del self.entries[k]
+
+    def hit_rate(self):
+        """Fraction of get() calls that did not need to compile."""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __repr__(self):
+        return "PlayerCache: {} scripts, {} hits, {} misses, hit rate {:.1%}".format(
+            len(self.entries), self.hits, self.misses, self.hit_rate())
@@ -0,0 +1,123 @@
+"""
+    Glicko ratings of players, updated after every game, and how much a
+    game between two players would tell us about them.
+
+    Each player has a rating mu and a deviation sigma, the uncertainty of
+    mu. A win scores 1, a draw 0.5 and a loss 0, whatever the victory
+    types. Updates are Glicko-1 (Glickman, 1999) with each game its own
+    rating period. sigma never drops below MIN_SIGMA, so ratings keep
+    following a player.
+
+    The information in a game is how much it is expected to shrink the
+    two players' variances, sigma squared. It is largest for uncertain
+    players who are close to each other, which is what the rating
+    scheduler (scheduler.RatedScheduler) plays first.
+"""
+import math
+import numpy as np
+from scoreboard import WIN, LOSS, DRAW
+
+START_MU = 1500.0
+START_SIGMA = 350.0
+MIN_SIGMA = 30.0
+Q = math.log(10) / 400
+
+def g(sigma):
+    """Glicko's discount for an opponent's uncertainty (works on arrays)."""
+    return 1 / np.sqrt(1 + 3 * Q * Q * np.square(sigma) / math.pi ** 2)
+
+def expected(mu, mu_opp, sigma_opp):
+    """Expected score against an opponent (works on arrays)."""
+    return 1 / (1 + 10 ** (-g(sigma_opp) * (mu - mu_opp) / 400))
+
+class Ratings:
+    def __init__(self):
+        self.mu = {}       # (name, syn): rating
+        self.sigma = {}    # (name, syn): deviation
+
+    def __contains__(self, k):
+        return k in self.mu
+
+    def add(self, k):
+        if k not in self.mu:
+            self.mu[k] = START_MU
+            self.sigma[k] = START_SIGMA
+
+    def remove(self, k):
+        self.mu.pop(k, None)
+        self.sigma.pop(k, None)
+
+    def period(self, k, results):
+        """New (mu, sigma) of k after results, a list of (opponent, score, number of games),
+           against the opponents' current ratings. Doesn't change anything.
+        """
+        mu, sigma = self.mu[k], self.sigma[k]
+        info = 0.0
+        delta = 0.0
+        for opp, score, n in results:
+            go = g(self.sigma[opp])
+            e = expected(mu, self.mu[opp], self.sigma[opp])
+            info += n * Q * Q * go * go * e * (1 - e)
+            delta += n * go * (score - e)
+        if info == 0:
+            return mu, sigma
+        var = 1 / (1 / sigma ** 2 + info)
+        return mu + Q * var * delta, max(MIN_SIGMA, math.sqrt(var))
+
+    def record(self, k1, k2, winner, n=1):
+        """Update k1 and k2 for n games of k1 (as player 1) vs k2, winner 0 for draw, else 1 or 2."""
+        s1 = {0: 0.5, 1: 1.0, 2: 0.0}[winner]
+        new1 = self.period(k1, [(k2, s1, n)])
+        new2 = self.period(k2, [(k1, 1 - s1, n)])
+        self.mu[k1], self.sigma[k1] = new1
+        self.mu[k2], self.sigma[k2] = new2
+
+    def load(self, score_board):
+        """Rate every player of score_board (a ScoreBoard) from all its results, as one period.
+           @return number of players rated
+        """
+        keys = score_board.keys()
+        for k in keys:
+            self.add(k)
+        new = {}
+        for k in keys:
+            results = []
+            for opp in keys:
+                if opp != k:
+                    t = score_board.pair(k, opp).sum(axis=(1, 2))
+                    results += [(opp, s, int(n)) for s, n in [(1.0, t[WIN]), (0.0, t[LOSS]), (0.5, t[DRAW])] if n > 0]
+            new[k] = self.period(k, results)
+        for k, (mu, sigma) in new.items():
+            self.mu[k], self.sigma[k] = mu, sigma
+        return len(new)
+
+    def information(self, keys):
+        """Array [i, j] of the expected drop in the variances of keys[i] and keys[j] from one game."""
+        mu = np.array([self.mu[k] for k in keys])
+        var = np.square([self.sigma[k] for k in keys])
+        sigma = np.sqrt(var)
+        e = expected(mu[:, None], mu[None, :], sigma[None, :])
+        gg = np.square(g(sigma))
+        fisher = Q * Q * e * (1 - e)
+        drop_i = var[:, None] - 1 / (1 / var[:, None] + fisher * gg[None, :])
+        drop_j = var[None, :] - 1 / (1 / var[None, :] + fisher * gg[:, None])
+        return drop_i + drop_j
+
+    def ranking(self):
+        """Keys, best first, by mu - 2 sigma: a rating the player is fairly sure to have."""
+        return sorted(self.mu, key=lambda k: self.mu[k] - 2 * self.sigma[k], reverse=True)
+
+    def confidence(self):
+        """Mean, over neighbours in ranking(), of the chance the higher one really is better."""
+        keys = self.ranking()
+        if len(keys) < 2:
+            return 1.0
+        p = [0.5 * (1 + math.erf((self.mu[a] - self.mu[b]) / math.sqrt(2 * (self.sigma[a] ** 2 + self.sigma[b] ** 2))))
+             for a, b in zip(keys, keys[1:])]
+        return sum(p) / len(p)
+
+    def summary(self, k):
+        """Dictionary of k's rating and deviation, or None if it has none."""
+        if k not in self.mu:
+            return None
+        return {"rating": self.mu[k], "deviation": self.sigma[k]}
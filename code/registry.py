@@ -0,0 +1,64 @@
+"""
+    The players in the tournament, indexed by (name, syn).
+
+    Writers (ADD, DEL, and run_games deleting a failed player) take a lock,
+    copy the dictionary, change the copy and publish it in one assignment.
+    Readers take the current dictionary with snapshot() and no lock. A
+    published dictionary is never changed, so readers never wait for a
+    writer and see one consistent set of players for as long as they hold
+    it. A snapshot that is the same object as last time means nothing has
+    changed since.
+
+    A writer can pass a function to run under the lock once its change is
+    published, so that eg queueing the file on disk to be saved or moved
+    happens in the same order as the changes themselves.
+"""
+from threading import Lock
+
+class Registry:
+    def __init__(self):
+        self.lock = Lock()   # taken by writers only
+        self.players = {}    # (name, syn): (name, syn, script, wins, losses), replaced, never changed
+
+    def snapshot(self):
+        """The current dictionary of (name, syn): player tuple. Don't change it."""
+        return self.players
+
+    def __contains__(self, k):
+        return k in self.players
+
+    def __len__(self):
+        return len(self.players)
+
+    def get(self, k):
+        """Player tuple of k = (name, syn), or None."""
+        return self.players.get(k)
+
+    def add(self, name, syn, script, then=None):
+        """Add player (name, syn), returning False if there already is one.
+           then - if not None, called with the new player tuple while the lock is held
+        """
+        k = (name, syn)
+        with self.lock:
+            if k in self.players:
+                return False
+            players = dict(self.players)
+            players[k] = (name, syn, script, 0, 0)
+            self.players = players
+            if then is not None:
+                then(players[k])
+        return True
+
+    def remove(self, k, then=None):
+        """Remove player k = (name, syn), returning its tuple, or None if there isn't one.
+           then - if not None, called with the removed player tuple while the lock is held
+        """
+        with self.lock:
+            if k not in self.players:
+                return None
+            players = dict(self.players)
+            p = players.pop(k)
+            self.players = players
+            if then is not None:
+                then(p)
+        return p
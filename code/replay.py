@@ -0,0 +1,79 @@
+"""
+    Play a recorded game again and say whether it came out the same.
+
+    python replay.py result.json player1.py player2.py
+
+    result.json is a game result as returned by Game.run_game, eg the
+    reply to TEST (with or without "SUCCESS " in front). Its seed (from
+    Game) gives the same columns and victory conditions, so players that
+    don't use randomness or the time play exactly the same game again.
+    Each script runs in a sandbox process, as in the tournament.
+"""
+from game import Game
+import sandbox
+import argparse
+import json
+
+def game_of(result):
+    """Return a Game set up as the one that gave result, a list from Game.run_game."""
+    board, p1, p2, _, _, seed = result
+    num_rows = len(next(iter(board.values())))
+    return Game(num_rounds=(num_rows - 1) // 2, num_cols=len(board),
+                vic_type1=Game.victory_types.index(p1[1]),
+                vic_type2=Game.victory_types.index(p2[1]),
+                same_col=(p1[2] == p2[2]), seed=seed)
+
+def replay(result, code1, code2):
+    """Play the game of result again with scripts code1 and code2.
+       @return (new result, list of differences as strings, empty if none)
+    """
+    g = game_of(result)
+    processes = [sandbox.PlayerProcess(code1), sandbox.PlayerProcess(code2)]
+    try:
+        new = g.run_game(processes[0].player(1), processes[1].player(2))
+    finally:
+        for p in processes:
+            p.close()
+    if len(new) == 2:
+        return new, ["player {} failed: {}".format(*new)]
+
+    diffs = []
+    if sorted(new[0]) != sorted(result[0]):
+        diffs.append("columns {} were {}".format(sorted(new[0]), sorted(result[0])))
+    else:
+        rows = len(next(iter(result[0].values())))
+        for i in range(rows):
+            old_row = {k: v[i] for k,v in result[0].items()}
+            new_row = {k: v[i] for k,v in new[0].items()}
+            if old_row != new_row:
+                diffs.append("row {} (player {}, round {}) is {} was {}".format(
+                             i, 2 - i % 2, (i - 1) // 2 + 1, new_row, old_row))
+                break
+    for i in (1, 2):
+        if tuple(new[i][1:]) != tuple(result[i][1:]):
+            diffs.append("player {} victory {} was {}".format(i, new[i][1:], result[i][1:]))
+    if new[3] != result[3]:
+        diffs.append("winner {} was {}".format(new[3], result[3]))
+    return new, diffs
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay a recorded game and compare.")
+    parser.add_argument("result", help="JSON file of the result, eg the reply to TEST")
+    parser.add_argument("player1", help="script of player 1")
+    parser.add_argument("player2", help="script of player 2")
+    args = parser.parse_args()
+
+    with open(args.result) as f:
+        text = f.read().strip()
+    if text.startswith("SUCCESS"):
+        text = text[len("SUCCESS"):]
+    result = json.loads(text)
+    with open(args.player1) as f1, open(args.player2) as f2:
+        new, diffs = replay(result, f1.read(), f2.read())
+
+    print("seed {}: {} ({}) vs {} ({}), winner {}".format(result[5], result[1][1], result[1][2],
+                                                          result[2][1], result[2][2], result[3]))
+    if diffs:
+        print("Different:\n  " + "\n  ".join(diffs))
+    else:
+        print("Identical")
@@ -0,0 +1,68 @@
+"""
+    Remember the outcome of games between deterministic players, so the
+    tournament can score a game it has already played instead of playing it.
+
+    A game is keyed on (hash of script 1, hash of script 2, vt1, vt2, seed):
+    with the same seed Game chooses the same columns, so deterministic
+    players produce the same board. Whether players are deterministic is
+    found out, not assumed: a key is only trusted once it has been played
+    twice with identical boards, and a key whose boards differ is never
+    trusted. Only a digest of the board and the winner are kept.
+"""
+import hashlib
+import json
+from collections import OrderedDict
+
+class ResultCache:
+    def __init__(self, max_size=1000000):
+        """max_size - keys kept, least recently used dropped first."""
+        self.max_size = max_size
+        self.entries = OrderedDict()   # key: [board digest, winner, trusted], or None if not deterministic
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(code1, code2, vic_type_index1, vic_type_index2, seed):
+        """The key of a game of scripts (or marshalled code) code1 vs code2."""
+        h = [hashlib.sha1(c.encode('utf-8') if isinstance(c, str) else c).hexdigest() for c in (code1, code2)]
+        return (h[0], h[1], vic_type_index1, vic_type_index2, seed)
+
+    @staticmethod
+    def digest(board):
+        """Digest of a board from Game.run_game."""
+        return hashlib.sha1(json.dumps(board, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        """The winner (0, 1 or 2) of the game for key if it is trusted, else None."""
+        entry = self.entries.get(key)
+        if entry is None or not entry[2]:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def put(self, key, result):
+        """Add result, a list from Game.run_game, of the game for key."""
+        if key in self.entries and self.entries[key] is None:
+            return
+        d = ResultCache.digest(result[0])
+        entry = self.entries.get(key)
+        if entry is None:
+            self.entries[key] = [d, result[3], False]
+        elif entry[0] == d and entry[1] == result[3]:
+            entry[2] = True
+        else:
+            self.entries[key] = None
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        """Fraction of get() calls that found a trusted result."""
+        total = self.hits + self.misses
+        return self.hits / total if total > 0 else 0.0
+
+    def __repr__(self):
+        return "ResultCache: {} games, {} hits, {} misses, hit rate {:.1%}".format(
+            len(self.entries), self.hits, self.misses, self.hit_rate())
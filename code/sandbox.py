@@ -0,0 +1,212 @@
+"""
+    Run player scripts in their own long lived processes.
+
+    A turn that runs over time is stopped by killing the process and
+    starting a new one, rather than being left running in a thread.
+    Each process serves every game its script plays, holding one Player
+    object per seat (1 or 2), so a turn costs one message each way. Every
+    new Player is made from a fresh exec of the script, so module globals
+    start afresh each game as they did when the server exec'd it per game.
+
+    Processes are started by a forkserver, not forked from the server,
+    which has many threads running.
+"""
+import marshal
+import hashlib
+import resource
+import signal
+import types
+import multiprocessing as mp
+from collections import OrderedDict
+
+CPU_TIME = 10        # CPU seconds allowed for one turn
+START_TIME = 30      # seconds allowed to exec a script (imports can be slow)
+MAX_PROCESSES = 32   # processes kept by player_process() in each server/worker process
+
+_context = mp.get_context("forkserver")
+
+def _module(code):
+    """A new module with code (a code object) exec'd in it."""
+    module = types.ModuleType('player_module')
+    exec(code, module.__dict__)
+    return module
+
+def _serve(conn, code, cpu_time):
+    """Child process: exec code then answer messages on conn until it closes.
+       Messages are ("new", seat), ("turn", seat, data, victory) or ("stop",).
+       "new" execs code again, so each Player has module globals of its own.
+       Replies are (True, value) or (False, error message), and for a turn
+       (True, row, CPU seconds it took, peak memory of the process in kB).
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)   # the server drains on Ctrl-C
+    try:
+        code = marshal.loads(code) if isinstance(code, bytes) else compile(code, 'player_module', 'exec')
+        module = _module(code)
+    except Exception as msg:
+        conn.send((False, "Could not exec script: {}".format(msg)))
+        return
+    conn.send((True, hasattr(module, "Player")))
+
+    players = {}
+    _, hard = resource.getrlimit(resource.RLIMIT_CPU)   # can't be raised without privileges, so kept
+    while True:
+        try:
+            msg = conn.recv()
+        except EOFError:
+            return
+        try:
+            if msg[0] == "new":
+                players[msg[1]] = _module(code).Player()
+                reply = (True, repr(players[msg[1]]))
+            elif msg[0] == "turn":
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                used = usage.ru_utime + usage.ru_stime
+                soft = int(used + cpu_time) + 1
+                if hard != resource.RLIM_INFINITY:
+                    soft = min(soft, hard)
+                resource.setrlimit(resource.RLIMIT_CPU, (soft, hard))
+                row = players[msg[1]].take_turn(msg[2], msg[3])
+                usage = resource.getrusage(resource.RUSAGE_SELF)
+                reply = (True, row, usage.ru_utime + usage.ru_stime - used, usage.ru_maxrss)
+            else:
+                return
+        except Exception as err:
+            reply = (False, err)
+
+        try:
+            conn.send(reply)
+        except Exception:   # unpicklable result or exception
+            conn.send((False, "{!r}".format(reply[1])))
+
+class PlayerProcess:
+    """A process running one player script. Raises RuntimeError if it won't start."""
+
+    def __init__(self, code, cpu_time=None):
+        """code     - python script, code object, or marshalled code object (bytes)
+           cpu_time - CPU seconds allowed per turn, default CPU_TIME
+        """
+        self.code = code if isinstance(code, (str, bytes)) else marshal.dumps(code)
+        self.cpu_time = CPU_TIME if cpu_time is None else cpu_time
+        self.start()
+
+    def start(self):
+        """Start (or restart) the process and exec the script in it."""
+        self.conn, child_conn = _context.Pipe()
+        self.process = _context.Process(target=_serve, args=(child_conn, self.code, self.cpu_time), daemon=True)
+        self.process.start()
+        child_conn.close()
+        reply = self._receive(START_TIME)
+        if reply is None or not reply[0]:
+            self.kill()
+            raise RuntimeError(reply[1] if reply else "Player script did not start")
+        self.has_player_class = reply[1]
+
+    def kill(self):
+        """Stop the process whatever it is doing."""
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def close(self):
+        """Ask the process to finish, killing it if it doesn't."""
+        try:
+            self.conn.send(("stop",))
+        except OSError:
+            pass
+        self.process.join(1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def _receive(self, duration):
+        """Return the reply from the process, or None if none within duration
+           seconds or it died (eg exceeded its CPU limit).
+        """
+        try:
+            if self.conn.poll(duration):
+                return self.conn.recv()
+        except (EOFError, OSError):
+            pass
+        return None
+
+    def call(self, msg, duration):
+        """Send msg and return the reply, as for _receive().
+           If there is no reply the process is restarted.
+        """
+        try:
+            self.conn.send(msg)
+        except (OSError, ValueError):
+            reply = None
+        else:
+            reply = self._receive(duration)
+        if reply is None:
+            self.kill()
+            self.start()
+        return reply
+
+    def player(self, seat, duration=START_TIME):
+        """Return a SandboxedPlayer for a new Player object in seat 1 or 2.
+           Raises RuntimeError if Player() fails.
+        """
+        reply = self.call(("new", seat), duration)
+        if reply is None or not reply[0]:
+            raise RuntimeError("Player() failed: {}".format(reply[1] if reply else "timed out"))
+        return SandboxedPlayer(self, seat, reply[1])
+
+class SandboxedPlayer:
+    """Stands in for a Player object living in a PlayerProcess."""
+
+    def __init__(self, process, seat, name):
+        self.process = process
+        self.seat = seat
+        self.name = name
+        self.cpu = 0.0      # CPU seconds used by take_turn
+        self.max_rss = 0    # peak memory of the process in kB
+
+    def take_turn_timeout(self, data, victory, duration):
+        """As Game.timeout(Player.take_turn, (data, victory), duration): return
+           None if it took too long (the process is killed and restarted),
+           an Exception if take_turn raised one, else the row returned.
+        """
+        try:
+            reply = self.process.call(("turn", self.seat, data, victory), duration)
+        except RuntimeError:   # timed out, and the script would not start again
+            return None
+        if reply is None:
+            return None
+        elif not reply[0]:
+            return reply[1] if isinstance(reply[1], Exception) else Exception(reply[1])
+        self.cpu += reply[2]
+        self.max_rss = max(self.max_rss, reply[3])
+        return reply[1]
+
+    def take_turn(self, data, victory):
+        return self.take_turn_timeout(data, victory, None)
+
+    def __repr__(self):
+        return self.name
+
+_processes = OrderedDict()   # sha1 of code: PlayerProcess, least recently used first
+
+def player_process(code):
+    """Return the running PlayerProcess for code, starting one if needed.
+       Processes are shared by every game in this process that uses code.
+    """
+    code = code if isinstance(code, (str, bytes)) else marshal.dumps(code)
+    k = hashlib.sha1(code if isinstance(code, bytes) else code.encode('utf-8')).hexdigest()
+    p = _processes.pop(k, None)
+    if p is None or not p.alive():
+        p = PlayerProcess(code)
+    _processes[k] = p
+    while len(_processes) > MAX_PROCESSES:
+        _processes.popitem(last=False)[1].close()
+    return p
+
+def close_all():
+    """Stop every process started by player_process()."""
+    while _processes:
+        _processes.popitem()[1].close()
@@ -4,96 +4,260 @@
     Server code taken from 
     https://www.binarytides.com/python-socket-server-code-example/
 
-    Server receives a JSON object with name:values as follows with "EOM" appended
-        "cmd": {"ADD" | "DEL" | "PING" | "TEST"}
-        "name": "team name"      # used in ADD and DEL
-        "syn": syndicate number  # only used for ADD
+    Server receives a JSON object with name:values as follows, either in a
+    length prefixed frame (see framing.py, optionally compressed) or with "EOM" appended
+        "cmd": {"ADD" | "DEL" | "PING" | "TEST" | "TEST_MATRIX" | "RESULT" | "STATS"}
+        "name": "team name"      # used in ADD and DEL, and STATS for one player
+        "syn": syndicate number  # only used for ADD (and to share out TEST games)
         "data": "python script"  # only used for ADD and DEL 
         "vt1": vic_type          # only used for TEST
         "vt2": vic_type          # only used for TEST
-        "data2": python script 2 # only used for TEST
+        "data2": python script 2 # only used for TEST and TEST_MATRIX
         "same_col": True/False   # only used for TEST
+        "seed": integer          # only used for TEST, to replay a game (see replay.py)
+        "reps": n                # only used for TEST_MATRIX, games per victory types and same_col
+        "async": True/False      # only used for TEST and TEST_MATRIX, reply with a job id rather than wait
+        "job": job id            # only used for RESULT
+        "wait": True/False       # only used for RESULT, wait for the job to finish
 
-    Server sends back a message terminated by \n
+    A connection sending framed requests stays open for more, and may send
+    several before reading the replies, which come back in order. client1.py
+    does this for you.
+
+    Server sends back a message terminated by \n, framed if the request was
         SUCCESS\n         # for ADD, DEL, PING
-        SUCCESS result\n  # for TEST
+        SUCCESS result\n  # for TEST, or RESULT of a finished job
+        SUCCESS matrix\n  # for TEST_MATRIX, JSON of wins, losses and draws of data
+                          # indexed [vt1][vt2], as on the leader board, and failures
+        SUCCESS job id\n  # for TEST or TEST_MATRIX with "async"
+        QUEUED n\n        # for RESULT of a job with n jobs ahead of it
+        RUNNING\n         # for RESULT of a job being played
+        SUCCESS stats\n   # for STATS, JSON of turn times (ms), CPU (s) and peak memory (kB)
         ERR ...\n
+
+    TEST games are run by a queue of --test-workers threads, so they 
+    cannot take over the machine from the tournament. A TEST waiting for
+    its game, or a RESULT with "wait", waits on the event loop and does
+    not count against --max-requests, so ADD, DEL and PING are not held up.
 """
 from game import Game
-import socket, sys, imp
-from threading import Lock
-from _thread import start_new_thread
+from player_cache import PlayerCache
+from scheduler import Scheduler, RatedScheduler
+from scoreboard import ScoreBoard, WIN, LOSS, DRAW
+from jobs import JobQueue, QUEUED, RUNNING, DONE
+from store import ResultStore
+from archive import Archive
+from turnstats import TurnStats
+from ratings import Ratings
+import framing
+from persist import Persister
+from registry import Registry
+from resultcache import ResultCache
+from distributed import RemotePool, read_secret, SECRET_FILE
+import sandbox
+from threading import Event, Thread
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, wait, as_completed, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing as mp
+import asyncio
+import argparse
 import json
 import time
 import random
-import numpy as np
-import yapf
-import os, shutil
+import os
+import io, csv
+import signal
 from datetime import datetime
  
 #HOST = 'localhost'   # Symbolic name, meaning all available interfaces
 HOST = '128.250.106.25' 
 PORT = 5002         # Arbitrary non-privileged port
+COORDINATOR_HOST = 'localhost'   # interface remote workers connect to, set with --coordinator-host
+COORDINATOR_SECRET = SECRET_FILE # file of the secret remote workers must know, set with --secret
+BACKLOG = 1024      # connections waiting to be accepted
+RECV_SIZE = 65536   # bytes read from a connection at once
+MAX_MESSAGE = 16 * 2**20   # longest request accepted, in bytes
+MAX_REQUESTS = 32   # commands run at once, set with --max-requests
+PIPELINE = 8        # commands of one connection run at once
+IDLE_TIMEOUT = 60   # seconds a kept alive connection may wait between requests
+
+TEST_WORKERS = 2    # TEST games run at once, set with --test-workers
+TEST_QUEUE = 100    # TEST games waiting before TEST is refused
+RESULT_WAIT = 300   # longest a RESULT with "wait" waits, in seconds
+test_jobs = None    # JobQueue for TEST, started by start_server
 
 SDIR = "mbusa"
 E_FILE = "e.html"
 
+LB_FILE = "lb.html"
+LB_JSON = "lb.json"
+LB_CSV = "lb.csv"
+LB_INTERVAL = 2     # minimum seconds between leader board writes, set with --lb-interval
+
+RESULTS_DB = "results.db"   # SQLite store of all results, set with --results
+
 BDIR = "mbusa_backups"
 BACKUP_FILE_NUMBER = 1
+PYC_DIR = "mbusa_pyc"   # compiled scripts in SDIR, kept by player_cache across restarts
+LOAD_THREADS = 8        # threads reading and compiling the scripts in SDIR at start up
+persister = Persister()   # writes scripts to SDIR and moves deleted ones to BDIR
 
-    # list of current players and their scripts: tuple (name, syn, script, wins, loses)
-players = []
-players_lock = Lock()
+    # current players and their scripts: (name, syn): tuple (name, syn, script, wins, loses)
+players = Registry()
 PLAYER_TUPLE_NAME = 0   # indexes into the tuples in players
 PLAYER_TUPLE_SYN  = 1
 PLAYER_TUPLE_CODE = 2
 PLAYER_TUPLE_WINS = 3
 PLAYER_TUPLE_LOSSES = 4
 
-def do_test(data, conn):
+NO_PLAYER_CLASS = "No Player class."
+
+stop_games = Event()    # set by drain_games() to stop run_games
+
+player_cache = PlayerCache()   # compiled scripts of players, cleared on ADD and DEL
+CACHE_REPORT_EVERY = 100       # games between printing player_cache hit rates
+
+turn_stats = TurnStats()       # take_turn times, CPU and memory of each player
+GAME_TIME = Game.GAME_TIME     # seconds of take_turn a player gets per game, set with --game-time
+ADAPTIVE_TIME = True           # tighten turn limits from turn_stats, unset with --fixed-time
+SYNC_BUDGET = 0.1              # most seconds of adding players to the scheduler between choosing games
+PENALTY_EVERY = 100            # games between updating the scheduler's penalties of slow players
+SEEDS = 0                      # if not 0, game n of a pairing has seed n % SEEDS and results of
+                               # deterministic players are cached (see resultcache.py), set with --seeds
+ratings = Ratings()            # Glicko rating of each player, updated with every result
+SCHEDULE = "exhaustive"        # "exhaustive": least played game next, "rating": most informative game
+                               # next (see RatedScheduler), which also ranks the leader board, set with --schedule
+
+MATRIX_WORKERS = 4    # most games of one TEST_MATRIX played at once, if test_jobs has slots free
+MAX_MATRIX_REPS = 10  # most games of a TEST_MATRIX for each victory types and same_col
+
+def do_test(data):
     """Run a single game with victory_types data["vt1"] and data["vt2"] 
-       and return result as a JSON object.
+       and return message for client, with the result as a JSON object.
+       Each script runs in its own sandbox process, stopped when the game ends.
     """
     if "vt1" not in data or "vt2" not in data:
-        conn.send("ERR: data needs keys 'vt1' and 'vt2' for TEST\n".encode('utf-8'))
-        return
+        return "ERR: data needs keys 'vt1' and 'vt2' for TEST\n".encode('utf-8')
 
     if "data" not in data or "data2" not in data:
-        conn.send("ERR: data needs keys 'data' and 'data2' for TEST\n".encode('utf-8'))
-        return
+        return "ERR: data needs keys 'data' and 'data2' for TEST\n".encode('utf-8')
 
     if data["vt1"] not in Game.victory_types:
-        conn.send("ERR: victory type {} doesn't exist for TEST\n".format(data["vt1"]).encode('utf-8'))
-        return
+        return "ERR: victory type {} doesn't exist for TEST\n".format(data["vt1"]).encode('utf-8')
 
     if data["vt2"] not in Game.victory_types:
-        conn.send("ERR: victory type {} doesn't exist for TEST\n".format(data["vt2"]).encode('utf-8'))
-        return
+        return "ERR: victory type {} doesn't exist for TEST\n".format(data["vt2"]).encode('utf-8')
         
     same_col = False
     if "same_col" in data:
         same_col = data["same_col"]
 
+    seed = data.get("seed")
+    if seed is not None and not isinstance(seed, int):
+        return "ERR: seed {} is not an integer for TEST\n".format(seed).encode('utf-8')
+
     vt1 = Game.victory_types.index(data["vt1"])
     vt2 = Game.victory_types.index(data["vt2"])
-    g = Game(vic_type1=vt1, vic_type2=vt2, same_col=same_col)
+    g = Game(vic_type1=vt1, vic_type2=vt2, same_col=same_col, seed=seed)
 
-    p1_module = imp.new_module('p1_module')
-    p2_module = imp.new_module('p2_module')
+    processes = []
     try:
-        exec(data["data"], p1_module.__dict__)
-        exec(data["data2"], p2_module.__dict__)
-        result = g.run_game(p1_module.Player(), p2_module.Player())
+        for code in (data["data"], data["data2"]):
+            processes.append(sandbox.PlayerProcess(code))
+        result = g.run_game(processes[0].player(1), processes[1].player(2))
         if len(result) == 2:
             raise Exception("Player {} failed: {}".format(result[0], result[1]))
     except Exception as msg:
-        conn.send("ERR: couldn't run game for TEST: {}\n".format(msg).encode('utf-8'))
+        return "ERR: couldn't run game for TEST: {}\n".format(msg).encode('utf-8')
     else:
-        conn.send("SUCCESS {}\n".format(json.dumps(result)).encode('utf-8'))
+        return "SUCCESS {}\n".format(json.dumps(result)).encode('utf-8')
+    finally:
+        for p in processes:
+            p.close()
+
+def do_test_matrix(data):
+    """Play data["data"] against data["data2"] data["reps"] times for every pair of 
+       victory types, with and without same_col, and return message for client with 
+       a JSON object of
+           "victory_types": Game.victory_types
+           "games": number played
+           "wins", "losses", "draws": [vt1][vt2] counts for data["data"]
+           "failures": [games player 1 failed, games player 2 failed]
+           "failure": message of the first failure, or null
+       The games are shared between the job's own game slot and up to MATRIX_WORKERS - 1
+       idle ones lent by test_jobs, so they count against --test-workers. Each slot's 
+       thread has a sandbox process for each script that it keeps for all its games.
+    """
+    if "data" not in data or "data2" not in data:
+        return "ERR: data needs keys 'data' and 'data2' for TEST_MATRIX\n".encode('utf-8')
+    try:
+        reps = int(data.get("reps", 1))
+    except (TypeError, ValueError):
+        return "ERR: data['reps'] is not an integer\n".encode('utf-8')
+    if not 1 <= reps <= MAX_MATRIX_REPS:
+        return "ERR: reps must be from 1 to {} for TEST_MATRIX\n".format(MAX_MATRIX_REPS).encode('utf-8')
+
+    n = len(Game.victory_types)
+    games = [(vt1, vt2, same_col) for vt1 in range(n) for vt2 in range(n) 
+                                  for same_col in (False, True) for _ in range(reps)]
+
+    def play(games):
+        """Play games, a list of (vt1, vt2, same_col), returning a list of (vt1, vt2, result)."""
+        processes = []
+        try:
+            for code in (data["data"], data["data2"]):
+                processes.append(sandbox.PlayerProcess(code))
+            results = []
+            for vt1, vt2, same_col in games:
+                g = Game(vic_type1=vt1, vic_type2=vt2, same_col=same_col)
+                try:
+                    p1 = processes[0].player(1)
+                except Exception as msg:
+                    results.append((vt1, vt2, (1, msg)))
+                    continue
+                try:
+                    p2 = processes[1].player(2)
+                except Exception as msg:
+                    results.append((vt1, vt2, (2, msg)))
+                    continue
+                results.append((vt1, vt2, g.run_game(p1, p2)))
+            return results
+        finally:
+            for p in processes:
+                p.close()
+
+    counts = [[[0] * n for _ in range(n)] for _ in range(3)]   # [WIN/LOSS/DRAW][vt1][vt2]
+    failures = [0, 0]
+    failure = None
+    lent = test_jobs.lend(MATRIX_WORKERS - 1)
+    slots = lent + 1
+    try:
+        with ThreadPoolExecutor(max_workers=slots) as ex:
+            for results in ex.map(play, [games[i::slots] for i in range(slots)]):
+                for vt1, vt2, result in results:
+                    if len(result) == 2:
+                        failures[result[0] - 1] += 1
+                        failure = failure or "Player {} failed: {}".format(result[0], result[1])
+                    else:
+                        counts[{1: WIN, 2: LOSS}.get(result[3], DRAW)][vt1][vt2] += 1
+    except Exception as msg:
+        return "ERR: couldn't run games for TEST_MATRIX: {}\n".format(msg).encode('utf-8')
+    finally:
+        test_jobs.give_back(lent)
+
+    matrix = {"victory_types": Game.victory_types, "games": len(games),
+              "wins": counts[WIN], "losses": counts[LOSS], "draws": counts[DRAW],
+              "failures": failures, "failure": failure}
+    return "SUCCESS {}\n".format(json.dumps(matrix)).encode('utf-8')
+
+def script_file(p):
+    """File in SDIR that player tuple p's script is saved in."""
+    return "{}/{}_{}.py".format(SDIR, p[PLAYER_TUPLE_NAME], p[PLAYER_TUPLE_SYN])
 
-def add_player(d):
+def add_player(d, save=True):
     """Return message for server. 
         d - dictionary with "data" "syn" and "name"
+        save - queue the script to be saved in SDIR (False when loading it from there)
     """
     try:
         d["syn"] = int(d["syn"])
@@ -109,22 +273,12 @@ def add_player(d):
     if "name" not in d:
         d["name"] = d["syn"]
 
-    players_lock.acquire()
-
-    if any([d["name"] == n and d["syn"] == s for n,s,_,_,_ in players]):
-        players_lock.release()
+    then = None
+    if save:    # queued under the registry's lock, so a DEL straight after is queued after it
+        then = lambda p: persister.save(script_file(p), p[PLAYER_TUPLE_CODE])
+    if not players.add(d["name"], d["syn"], d["data"], then=then):
         return("ERR: Player already exists\n".encode('utf-8'))
-
-    players.append((d["name"], d["syn"], d["data"], 0, 0)) 
-    players_lock.release()
-
-    fname = "{}/{}_{}.py".format(SDIR, d["name"], d["syn"])
-    with open(fname, "w") as f:
-        f.write(d["data"])
-    try:
-        yapf.FormatFiles([fname], [(1,100000)], in_place=True)  # assumes no more than 100000 lines of code
-    except Exception:
-        print("Cannot yapf {}\n".format(fname)) 
+    player_cache.invalidate((d["name"], d["syn"]))
 
     print("ADDED {1}_{0}".format(d["syn"], d["name"]))
     return("SUCCESS\n".encode('utf-8'))
@@ -132,137 +286,216 @@ def add_player(d):
 def delete_player(d):
     """ d = {"name":..., "syn":...}
         Returns a message to send to client.
-        Assumes players is locked
+        The file is moved to BDIR later by persister.
     """
     if "name" not in d or "syn" not in d:
         return "ERR: missing name or syn in DEL\n".encode('utf-8')
+    try:
+        k = (d["name"], int(d["syn"]))
+    except ValueError:
+        return "ERR: data['syn'] is not an integer\n".encode('utf-8')
 
-    global players
-    names = [p[PLAYER_TUPLE_NAME] for p in players]
-    if d["name"] in names:
+    p = players.remove(k, then=lambda p: persister.delete(script_file(p), BDIR))
+    if p is not None:
         print("Deleting {}".format(d["name"]))
-        i = names.index(d["name"]) 
-        players.pop(i)
-
-        fname = "{}/{}_{}.py".format(SDIR, d["name"], d["syn"])
-        try:
-            print("Copied: {} to {}".format(fname, shutil.copy(fname, BDIR)))
-            os.remove(fname)
-        except OSError:
-            msg = "ERR: couldn't delete file\n".encode('utf-8')
-        else:
-            msg = "SUCCESS\n".encode('utf-8')
-            print('DELETED {} {}'.format(d["name"], d["syn"]))
+        player_cache.invalidate((p[PLAYER_TUPLE_NAME], p[PLAYER_TUPLE_SYN]))
+        msg = "SUCCESS\n".encode('utf-8')
+        print('DELETED {} {}'.format(d["name"], d["syn"]))
     else:
         msg = "ERR: name {} doesn't exist\n".format(d["name"]).encode('utf-8')
 
     return msg
 
-def clientthread(conn):
-    """Loop reading the code then close.
+def handle_command(data):
+    """Run the command in data (JSON string without "EOM") and return message for client.
        If name does not exist for ADD, use syndicate number.
        DEL by name.
     """
-    try:
-        data = ''
-        while data == '' or data[-3:] != "EOM":
-            data += conn.recv(1024).decode('utf-8')
+    d = json.loads(data)
+    if "cmd" not in d:
+        return "ERR: No cmd in {} \n".format(data).encode('utf-8')
+    elif d["cmd"] == "PING":
+        return "SUCCESS\n".encode('utf-8')
+    elif d["cmd"] == "ADD":
+        return add_player(d)
+    elif d["cmd"] == "DEL":
+        print("DELETE command")
+        if "name" not in d:
+            return "ERR: Missing name in {} \n".format(data).encode('utf-8')
+        return delete_player(d)
+    elif d["cmd"] in ("TEST", "TEST_MATRIX"):
+        func = do_test if d["cmd"] == "TEST" else do_test_matrix
+        job = test_jobs.submit(func, (d,), owner=d.get("syn"))
+        if job is None:
+            return "ERR: too many TESTs queued, try again later\n".encode('utf-8')
+        job_id, future = job
+        if d.get("async", False):
+            return "SUCCESS {}\n".format(job_id).encode('utf-8')
+        return wait_for_job(future)
+    elif d["cmd"] == "RESULT":
+        if "job" in d and d.get("wait", False):
+            return wait_for_result(d)
+        return job_result(d)
+    elif d["cmd"] == "STATS":
+        return player_stats(d)
+    else:
+        return "ERR: Unknown cmd {} \n".format(d["cmd"]).encode('utf-8')
 
-        d = json.loads(data[:-3])  # strip "EOM"
-        if "cmd" not in d:
-            conn.send("ERR: No cmd in {} \n".format(data).encode('utf-8'))
-        else:
-            if d["cmd"] == "PING":
-                conn.send("SUCCESS\n".encode('utf-8'))
-            elif d["cmd"] == "ADD":
-                msg = add_player(d)
-                conn.send(msg)
-            elif d["cmd"] == "DEL":
-                print("DELETE command")
-                if "name" not in d:
-                    conn.send("ERR: Missing name in {} \n".format(data).encode('utf-8'))
-                else:
-                    players_lock.acquire()
-                    msg = delete_player(d)
-                    conn.send(msg)
-                    players_lock.release()
-            elif d["cmd"] == "TEST":
-                res = do_test(d, conn)
-
-        conn.close()
+def player_stats(d):
+    """Return message for client for STATS: turn time percentiles, CPU and memory 
+       of player (d["name"], d["syn"]), or of every player if d has no "name".
+    """
+    if "name" not in d:
+        stats = [dict(name=k[0], syn=k[1], **v) for k,v in turn_stats.summaries().items()]
+        return "SUCCESS {}\n".format(json.dumps(stats)).encode('utf-8')
+    try:
+        k = (d["name"], int(d.get("syn", -1)))
+    except ValueError:
+        return "ERR: data['syn'] is not an integer\n".encode('utf-8')
+    v = turn_stats.summary(k)
+    if v is None:
+        return "ERR: no stats for {} {}\n".format(*k).encode('utf-8')
+    return "SUCCESS {}\n".format(json.dumps(dict(name=k[0], syn=k[1], **v))).encode('utf-8')
+
+def job_result(d):
+    """Return message for client for RESULT of job d["job"], as it is now."""
+    if "job" not in d:
+        return "ERR: Missing job in RESULT\n".encode('utf-8')
+    state, value = test_jobs.status(d["job"])
+
+    if state == DONE:
+        return value
+    elif state == QUEUED:
+        return "QUEUED {}\n".format(value).encode('utf-8')
+    elif state == RUNNING:
+        return "RUNNING\n".encode('utf-8')
+    return "ERR: no job {}\n".format(d["job"]).encode('utf-8')
+
+async def wait_for_job(future):
+    """The reply of a TEST job, once future (from test_jobs.submit) has it."""
+    return await asyncio.wrap_future(future)
+
+async def wait_for_result(d):
+    """job_result(d) once job d["job"] has finished, or after RESULT_WAIT seconds."""
+    future = test_jobs.future(d["job"])
+    if future is not None:
+        try:
+            await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(future)), RESULT_WAIT)
+        except asyncio.TimeoutError:
+            pass
+    return job_result(d)
+
+async def serve_client(reader, writer, limit, executor):
+    """Read requests, framed or "EOM" terminated (see framing.py), run them and reply.
+       A connection sending framed requests is kept open for more, up to IDLE_TIMEOUT 
+       seconds apart, and may pipeline them: up to PIPELINE run at once and the 
+       replies come back in the order of the requests. A legacy request is the 
+       only one on its connection.
+       limit - asyncio.Semaphore bounding the commands running at once. While it is 
+               full, requests wait here rather than piling up threads. TESTs
+               waiting for their game have left it (see run_command).
+    """
+    addr = writer.get_extra_info('peername')
+    print('Connected with {} {}'.format(addr[0], addr[1]))
+    replies = asyncio.Queue(PIPELINE)   # tasks giving the replies, in request order; None ends
+    sender = asyncio.ensure_future(send_replies(writer, replies))
+    data = b""
+    try:
+        while True:
+            try:
+                data, flags = await asyncio.wait_for(framing.read_message(reader, MAX_MESSAGE, RECV_SIZE), IDLE_TIMEOUT)
+            except framing.FrameError as msg:
+                error = asyncio.get_running_loop().create_future()
+                error.set_result("ERR: {}\n".format(msg).encode('utf-8'))
+                await replies.put(error)
+                break
+            if data is None:
+                break       # client closed the connection
+            await replies.put(asyncio.ensure_future(run_command(data, flags, limit, executor)))
+            if flags is None:
+                break
+    except (asyncio.IncompleteReadError, asyncio.TimeoutError):
+        pass                # client went away part way through a request, or was idle
     except Exception as msg:
         print(msg)
         print("Data:")
-        print(data)
+        print(data[:1000])
+    finally:
+        await replies.put(None)
+        await sender
+        writer.close()
+
+async def run_command(data, flags, limit, executor):
+    """Reply bytes to request data (bytes) received with flags, from handle_command in executor.
+       If that gives a coroutine (a TEST or RESULT waiting for a job), it is awaited
+       here after leaving limit, so the wait holds neither a thread nor a place in limit.
+    """
+    try:
+        async with limit:
+            loop = asyncio.get_running_loop()
+            msg = await loop.run_in_executor(executor, handle_command, data.decode('utf-8'))
+        if asyncio.iscoroutine(msg):
+            msg = await msg
+    except Exception as e:
+        msg = "ERR: {}\n".format(e).encode('utf-8')
+    return framing.reply(msg, flags)
+
+async def send_replies(writer, replies):
+    """Write the reply of each task from queue replies, in order, until None.
+       If the client has gone, the remaining tasks are still waited for so none are left running.
+    """
+    while True:
+        task = await replies.get()
+        if task is None:
+            return
+        msg = await task
+        try:
+            writer.write(msg)
+            await writer.drain()
+        except Exception as e:
+            print(e)
+
+async def serve(num_requests):
+    """Accept connections until cancelled, running at most num_requests commands at once."""
+    limit = asyncio.Semaphore(num_requests)
+    executor = ThreadPoolExecutor(max_workers=num_requests)
+    server = await asyncio.start_server(lambda r, w: serve_client(r, w, limit, executor),
+                                        HOST, PORT, backlog=BACKLOG, limit=RECV_SIZE)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
 
-def check_all_on_score_board(score_board):
-    """ Check score board has all the players.
+def check_all_on_score_board(score_board, snapshot):
+    """ Check score board has all the players in snapshot (from players.snapshot()).
         Note: may change score_board!
-        Assumes players is locked.
     """
-    global players
-    for p in players:
-        k = (p[PLAYER_TUPLE_NAME], p[PLAYER_TUPLE_SYN]) 
-        if k not in score_board:
-            n = len(Game.victory_types)
-            score_board[k] = {(p[PLAYER_TUPLE_NAME], p[PLAYER_TUPLE_SYN]):[np.zeros((n,n)) for i in [1,2,3]] for p in players}
-            for k2 in score_board:
-                score_board[k2][k] = [np.zeros((n,n)) for i in [1,2,3]]
-
-def check_no_extras_on_score_board(score_board):
-    """ Check score board does not have deleted players.
+    for k in snapshot:
+        score_board.add(k)
+
+def check_no_extras_on_score_board(score_board, snapshot):
+    """ Check score board does not have players deleted from snapshot (from players.snapshot()).
         Note: may change score_board!
-        Assumes players is locked.
+        @return list of keys removed
     """
-    global players
-    to_remove = []
-    for k in score_board:
-        if not any((p[PLAYER_TUPLE_NAME], p[PLAYER_TUPLE_SYN]) == k for p in players):
-            to_remove.append(k)
-
-    for k in to_remove:
-        score_board.pop(k, None) 
-        for kk in score_board:    # remove from rows too
-            score_board[kk].pop(k, None)
-
-def choose_game(score_board):
+    removed = [k for k in score_board.keys() if k not in snapshot]
+    for k in removed:
+        score_board.remove(k)
+    return removed
+
+def choose_game(scheduler):
     """Find the pairing that has played the least (ie sum of wins and loss count smallest).
+       @param scheduler is a Scheduler kept in step with score_board by run_games.
        @return (key1, key2, index1 into game.victory_types, index2) to index score_board for pairing.
                (None,None,None,None) if no game available
-        Assumes players is locked.
-    """
-    global players
-    if len(players) < 2:
-        return (None, None, None, None)
-
-    k1 = (players[0][PLAYER_TUPLE_NAME], players[0][PLAYER_TUPLE_SYN])
-    k2 = (players[1][PLAYER_TUPLE_NAME], players[1][PLAYER_TUPLE_SYN])
-    min_num_games = sum([score_board[k1][k2][i][0][0] for i in [0,1,2]])
-    min_keys = (k1, k2, 0, 0)
-    for k1 in score_board:
-        for k2 in score_board:
-            if k1 != k2 and k1[1] != k2[1] :
-                for index1 in range(len(Game.victory_types)):
-                    for index2 in range(len(Game.victory_types)):
-                        s = sum(wld[index1][index2] for wld in score_board[k1][k2])
-                        if s < min_num_games:
-                            min_num_games = s
-                            min_keys = (k1, k2, index1, index2)
-    return min_keys
-
-    """
-    p1 = random.randint(0, len(players)-1)
-    p2 = random.randint(0, len(players)-1)
-    v1 = random.randint(0, len(Game.victory_types)-1)
-    v2 = random.randint(0, len(Game.victory_types)-1)
-    k1 = (players[p1][PLAYER_TUPLE_NAME], players[p1][PLAYER_TUPLE_SYN])
-    k2 = (players[p2][PLAYER_TUPLE_NAME], players[p2][PLAYER_TUPLE_SYN])
-    return (k1, k2, v1, v2)
+       The pairing is in flight until scheduler.record() or scheduler.release() is called for it.
     """
+    return scheduler.choose()
 
 def print_score_board(score_board):
     """Pretty cross table of round robin in order of total wins.
-       @param score_board is dict of dict of [[win],[losses],[draw]]
+       @param score_board is a ScoreBoard
     """
     def line():
         print("{}+".format("".join(["-"]*18)), end="")
@@ -270,9 +503,8 @@ def print_score_board(score_board):
             print("{}+".format("".join(["-"]*18)), end="")
         print("")
 
-    keys = score_board.keys()
-    wins = [sum([np.sum(wld[0]) for _,wld in score_board[k].items()]) for k in keys]
-    keys = [x for _,x in sorted(zip(wins,keys), reverse=True)]
+    totals = score_board.totals()
+    keys = sorted(totals, key=lambda k: (totals[k][WIN], repr(k)), reverse=True)
 
     line()
 
@@ -284,9 +516,7 @@ def print_score_board(score_board):
         print("{:>16}{:2}|".format(k1[0], k1[1]), end="")
         wins = losses = draws = 0
         for k2 in keys:
-            w = np.sum(score_board[k1][k2][0])
-            l = np.sum(score_board[k1][k2][1])
-            d = np.sum(score_board[k1][k2][2])
+            w, l, d = score_board.pair(k1, k2).sum(axis=(1,2))
             print("{:>5}/{:>5}/{:>6}|".format(w,l,d), end="")
             wins   += w
             losses += l
@@ -296,22 +526,25 @@ def print_score_board(score_board):
 
     line()
 
+def ranked(score_board):
+    """Keys of score_board, best first: by rating (Ratings.ranking) if SCHEDULE is "rating",
+       else by win-loss ratio.
+    """
+    if SCHEDULE == "rating":
+        return [k for k in ratings.ranking() if k in score_board]
+    wl = score_board.win_loss_ratios()
+    return sorted(wl, key=lambda k: (wl[k], repr(k)), reverse=True)   # names may be str or int
+
 def print_leader_board(score_board):
-    """Pretty each teams wins/losses/draws in order of total wins.
-       @param score_board is dict of dict of [[win],[losses],[draw]]
-              primary key (name, syn) 
+    """Pretty each teams wins/losses/draws in order of ranked().
+       @param score_board is a ScoreBoard, primary key (name, syn) 
     """
-    keys = score_board.keys()
-    wins = {k:sum((sum((sum(i) for i in wld[0])) for _,wld in score_board[k].items())) for k in keys}
-    loss = {k:sum((sum((sum(i) for i in wld[1])) for _,wld in score_board[k].items())) for k in keys}
-    for k in loss:
-        if loss[k] == 0:
-            loss[k] = 0.1
-    wl = { k:(wins[k] / loss[k]) for k in keys }
-    keys = [k for _,k in sorted([(v,k) for k,v in wl.items()], reverse=True)]
+    wins = {k:t[WIN] for k,t in score_board.totals().items()}
+    wl = score_board.win_loss_ratios()
+    keys = ranked(score_board)
 
     s = ["<html>\n<body>\n<h3>BUSA90500 Programming Assignment</h3>"]
-    s = ["<p>Games played: {}".format(sum(wins.values()))]
+    s = ["<p>Games played: {}, ranking confidence {:.3f}".format(sum(wins.values()), ratings.confidence())]
     s += ['<table style="text-align:center">'] 
 
     n = len(Game.victory_types)
@@ -319,6 +552,13 @@ def print_leader_board(score_board):
         s += ['<tr><td style="border-bottom:1px solid black" colspan="100%"></td></tr>']
 
         s += ['<tr><td colspan="15" style="text-align:left">{:>16} ({:1}) win-loss-ratio={}</td></tr>'.format(k[0], k[1], wl[k])]
+        r = ratings.summary(k)
+        if r is not None:
+            s += ['<tr><td colspan="15" style="text-align:left">rating {:.0f} &plusmn; {:.0f}</td></tr>'.format(r["rating"], 2 * r["deviation"])]
+        st = turn_stats.summary(k)
+        if st is not None:
+            s += ['<tr><td colspan="23" style="text-align:left">turn ms p50={:.1f} p95={:.1f} max={:.1f}, CPU {:.1f}s, peak memory {:.0f}MB</td></tr>'.format(
+                  st["p50_ms"], st["p95_ms"], st["max_ms"], st["cpu_s"], st["max_rss_kb"] / 1024)]
         s += ['<tr><td></td>']
         s += ['<td style="border-bottom:1px solid black" colspan="{}">Wins</td><td></td>'.format(len(Game.victory_types))]
         s += ['<td style="border-bottom:1px solid black" colspan="{}">Draws</td><td></td>'.format(len(Game.victory_types))]
@@ -327,13 +567,7 @@ def print_leader_board(score_board):
         s += ["<tr><td></td><td>{}".format("<td>".join(Game.victory_types))]
         s += ["<td></td><td>{}".format("<td>".join(Game.victory_types))]
         s += ["<td></td><td>{}</tr>".format("<td>".join(Game.victory_types))]
-        ws = np.zeros((n,n), dtype="int")
-        ds = np.zeros((n,n), dtype="int")
-        ls = np.zeros((n,n), dtype="int")
-        for k2 in keys:
-            ws += np.array(score_board[k][k2][0]).astype(int)
-            ds += np.array(score_board[k][k2][1]).astype(int)
-            ls += np.array(score_board[k][k2][2]).astype(int)
+        ws, ds, ls = score_board.player(k)   # wins, losses, draws
 
         for row in range(n):
             s += ["<tr><td>{}</td>".format(Game.victory_types[row])]
@@ -343,10 +577,63 @@ def print_leader_board(score_board):
 
     s += ["</table></body></html>"]
 
-    with open('lb.html', "w") as f:
-        f.write("\n".join(s))
+    write_atomically(LB_FILE, "\n".join(s))
     #print("\n".join(s))
 
+def export_leader_board(score_board):
+    """Write the leader board as JSON to LB_JSON and CSV to LB_CSV for dashboards.
+       JSON is a list in order of ranked() of
+           {"name", "syn", "wins", "losses", "draws", "win_loss_ratio", "rating", "deviation",
+            "victory_types", "matrix": {"wins", "losses", "draws"}, "stats"}
+       where each matrix is indexed [own victory type][opponent's victory type]
+       and stats is as for the STATS command (or null).
+    """
+    totals = score_board.totals()
+    wl = score_board.win_loss_ratios()
+    keys = ranked(score_board)
+
+    rows = []
+    for k in keys:
+        ws, ls, ds = score_board.player(k)
+        rows.append({"name": k[0], "syn": k[1], 
+                     "wins": int(totals[k][WIN]), "losses": int(totals[k][LOSS]), "draws": int(totals[k][DRAW]),
+                     "win_loss_ratio": float(wl[k]),
+                     **(ratings.summary(k) or {"rating": None, "deviation": None}),
+                     "victory_types": Game.victory_types,
+                     "matrix": {"wins": ws.tolist(), "losses": ls.tolist(), "draws": ds.tolist()},
+                     "stats": turn_stats.summary(k)})
+    write_atomically(LB_JSON, json.dumps(rows))
+
+    out = io.StringIO()
+    w = csv.writer(out)
+    stat_keys = ["p50_ms", "p95_ms", "max_ms", "cpu_s", "max_rss_kb"]
+    w.writerow(["name", "syn", "wins", "losses", "draws", "win_loss_ratio", "rating", "deviation"] + stat_keys)
+    for r in rows:
+        st = r["stats"] or {}
+        w.writerow([r["name"], r["syn"], r["wins"], r["losses"], r["draws"], r["win_loss_ratio"], r["rating"], r["deviation"]]
+                   + [st.get(x, "") for x in stat_keys])
+    write_atomically(LB_CSV, out.getvalue())
+
+def update_leader_board(score_board, last, force=False):
+    """Rewrite the leader board files if results have changed since they were last
+       written and it was at least LB_INTERVAL seconds ago (or force).
+       last - (score_board.version, time) of the last write
+       @return (version, time) of the latest write
+    """
+    now = time.time()
+    if score_board.version == last[0] or (not force and now - last[1] < LB_INTERVAL):
+        return last
+    print_leader_board(score_board)
+    export_leader_board(score_board)
+    return (score_board.version, now)
+
+def write_atomically(fname, text):
+    """Write text to fname so readers never see a partly written file."""
+    tmp = "{}.tmp".format(fname)
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, fname)
+
 def write_to_e(msg, player, action):
     """all are strings. msg<br>player written to column 2, action to column 3
     """
@@ -355,151 +642,372 @@ def write_to_e(msg, player, action):
         f.write("<td>{}{}</td>".format(msg, player))
         f.write("<td>{}</td></tr>".format(action))
 
-def run_games():
-    """Thread running to randomly choose pairs from players and 
+def play_game(code1, code2, vic_type_index1, vic_type_index2, turn_limits=(Game.TIME, Game.TIME), game_time=Game.GAME_TIME, seed=None):
+    """Run one tournament game of code1 against code2, as from player_cache.get(),
+       with the time limits of Game.run_game and Game seed (None for a random one).
+       Each script runs in a sandbox process that is kept for its later games.
+       Runs in a worker process when run_games has a pool, so only returns things that pickle:
+       (result, usage) where result is
+           the list returned by Game.run_game,
+           [None, None, None, winner, "forfeit", seed] if the loser ran out of a time 
+               limit tighter than Game.TIME (its adaptive turn limit or game_time),
+           (player number, message string) if that player failed during the game, or
+           (player number, NO_PLAYER_CLASS) if that player's script has no Player class.
+       and usage is None or, for each player, (take_turn times, CPU seconds, peak memory in kB).
+    """
+    processes = [sandbox.player_process(code1), sandbox.player_process(code2)]
+    for i, p in enumerate(processes):
+        if not p.has_player_class:
+            return ((i + 1, NO_PLAYER_CLASS), None)
+
+    g = Game(vic_type1=vic_type_index1, vic_type2=vic_type_index2, seed=seed)
+    players = [processes[0].player(1), processes[1].player(2)]
+    result = g.run_game(*players, turn_limits=turn_limits, game_time=game_time)
+    if len(result) == 2 and g.timed_out is not None and g.timed_out[1] < Game.TIME:
+        print("Player {} forfeits: {}".format(*result))
+        result = [None, None, None, 3 - result[0], "forfeit", g.seed]
+    elif len(result) == 2:
+        result = (result[0], str(result[1]))  # exceptions might not pickle
+    usage = [(g.turn_times[i], p.cpu, p.max_rss) for i, p in enumerate(players)]
+    return (result, usage)
+
+def record_result(score_board, scheduler, game, outcome, store=None, archive=None):
+    """Update score_board, scheduler, turn_stats, store (a ResultStore, if not None) 
+       and archive (an Archive, if not None) with outcome = (result, usage) of play_game for game = (k1, k2, vic_type_index1, vic_type_index2).
+       Deletes a player that failed, but not one that forfeited. Only the run_games thread should call this.
+       @return result
+    """
+    k1, k2, vic_type_index1, vic_type_index2 = game
+    result, usage = outcome
+    print(result)
+    if usage is not None:
+        turn_stats.add(k1, *usage[0])
+        turn_stats.add(k2, *usage[1])
+    if len(result) == 2 or k1 not in score_board or k2 not in score_board:
+        scheduler.release(game)
+    else:
+        scheduler.record(game)
+
+    if len(result) == 2:
+        k = k1 if result[0] == 1 else k2
+        print(delete_player({"name": k[0], "syn": k[1]}))
+        if result[1] == NO_PLAYER_CLASS:
+            write_to_e(NO_PLAYER_CLASS, k, "Not started")
+        elif result[0] == 1:
+            write_to_e(k, result[1], Game.victory_types[vic_type_index1])
+        else:
+            write_to_e(k, result[1], Game.victory_types[vic_type_index2])
+        print(k)
+    elif k1 not in score_board or k2 not in score_board:
+        print("Dropped result for deleted player {} or {}".format(k1, k2))
+    else:
+        score_board.record(k1, k2, vic_type_index1, vic_type_index2, result[3])
+        ratings.record(k1, k2, result[3])
+        if store is not None:
+            store.record(k1, k2, vic_type_index1, vic_type_index2, result[3])
+        if archive is not None and result[0] is not None:
+            archive.add(k1, k2, vic_type_index1, vic_type_index2, result)
+    return result
+
+def record_future(score_board, scheduler, game, future, store=None, archive=None):
+    """record_result for a finished future from the pool, game = (k1, k2, vt1, vt2).
+       @return result, or None if the game raised an exception
+    """
+    try:
+        return record_result(score_board, scheduler, game, future.result(), store, archive)
+    except Exception as msg:
+        scheduler.release(game)
+        print("Exception when trying to run a game")
+        print(msg)
+
+def ignore_sigint():
+    """Pool worker initializer: leave Ctrl-C to the server so games in progress can drain."""
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+def process_pool(num_workers):
+    """Pool of num_workers processes for play_game. They are started by a forkserver,
+       as forking this process while its other threads hold locks (eg stdout's)
+       could leave a worker deadlocked.
+    """
+    return ProcessPoolExecutor(max_workers=num_workers, initializer=ignore_sigint,
+                               mp_context=mp.get_context("forkserver"))
+
+def drain_games():
+    """Ask run_games to stop choosing games. It returns once games already
+       handed to workers have finished and been recorded.
+    """
+    stop_games.set()
+
+def time_limits(k1, k2):
+    """Turn limits of k1 and k2 for their next game: Game.TIME, or tighter from
+       their turn_stats if ADAPTIVE_TIME.
+    """
+    if not ADAPTIVE_TIME:
+        return (Game.TIME, Game.TIME)
+    return (turn_stats.turn_limit(k1, Game.TIME), turn_stats.turn_limit(k2, Game.TIME))
+
+def run_games(num_workers=1, results_db=None, coordinator=None, archive_dir=None):
+    """Thread running to choose pairs from players and
        run them against each other in a game.
 
-       score_board is a dictionary indexed by (name, syn) keeping wins, losses and draws for that key.
+       num_workers - if more than 1, games are run in parallel in that many worker 
+                     processes, and their results come back to this thread, 
+                     which is the only one that touches score_board.
+       results_db  - file of the ResultStore that results are saved in and loaded 
+                     from at the start (for the players already in players), 
+                     or None to keep them only in memory.
+       coordinator - if not None, a port of COORDINATOR_HOST to listen on for remote 
+                     workers knowing COORDINATOR_SECRET (see distributed.py), which play 
+                     the games instead of local processes, as many at once as they have slots.
+       archive_dir - if not None, a directory every finished board is archived in 
+                     (see archive.py).
+
+       score_board is a ScoreBoard indexed by (name, syn) keeping wins, losses and draws for that key.
     """
-    score_board = {}  # key = (name, syn), value = { (name, syn): [wins for key, losses for key, draws for key]}
-    while True:
-        players_lock.acquire()
-        check_all_on_score_board(score_board)
-        check_no_extras_on_score_board(score_board)
+    score_board = ScoreBoard(len(Game.victory_types))
+    if coordinator is not None:
+        pool = RemotePool(COORDINATOR_HOST, coordinator, read_secret(COORDINATOR_SECRET))
+    elif num_workers > 1:
+        pool = process_pool(num_workers)
+    else:
+        pool = None
+    if SCHEDULE == "rating":
+        scheduler = RatedScheduler(len(Game.victory_types), ratings)
+    else:
+        scheduler = Scheduler(len(Game.victory_types))
+    pending = {}      # future: (k1, k2, vic_type_index1, vic_type_index2) for games in the pool
+    num_games = 0
+    lb_written = (None, 0)   # (score_board.version, time) of last leader board write
+    synced = None            # players.snapshot() the score board and scheduler last matched
+    cache = ResultCache() if SEEDS else None
+    cache_keys = {}          # game: ResultCache key, for games being played that could be cached
+
+    def remember(game, result):
+        key = cache_keys.pop(game, None)
+        if key is not None and result is not None and result[4] == "gg":
+            cache.put(key, result)
+
+    archive = Archive(archive_dir) if archive_dir is not None else None
+    store = None
+    if results_db is not None:
+        store = ResultStore(results_db)
+        check_all_on_score_board(score_board, players.snapshot())
+        print("Loaded {} results from {}".format(store.load(score_board), results_db))
+        ratings.load(score_board)
+
+    while not stop_games.is_set():
+        codes = players.snapshot()
+        if codes is not synced:
+            check_all_on_score_board(score_board, codes)
+            for k in check_no_extras_on_score_board(score_board, codes):
+                turn_stats.remove(k)
+                ratings.remove(k)
+                if store is not None:
+                    store.forget(k)
+            for k in score_board.keys():
+                ratings.add(k)
+            if scheduler.sync(score_board.keys(), score_board, SYNC_BUDGET):
+                synced = codes
+
+            # fill any idle workers, never choosing a game already being played
+        games = []
+        slots = num_workers if coordinator is None else pool.slots()
+        while len(pending) + len(games) < slots:
+            try:
+                game = choose_game(scheduler)
+            except Exception as msg:
+                print("Exception when trying to choose a game")
+                print(msg)
+                break
+            if game[0] is None:
+                break
+            games.append(game)
 
+            # score_board belongs to this thread
         #print_score_board(score_board)
-        print_leader_board(score_board)
+        lb_written = update_leader_board(score_board, lb_written)
 
-        k1, k2, vic_type_index1, vic_type_index2 = choose_game(score_board)
-        players_lock.release()
-        if k1 is not None:
+        for game in games:
+            k1, k2, vic_type_index1, vic_type_index2 = game
             print("{} ({}) vs {} ({})".format(k1, Game.victory_types[vic_type_index1], k2, Game.victory_types[vic_type_index2]))
+            seed = None
+            if cache is not None:
+                seed = scheduler.counts[game] % SEEDS
+                key = ResultCache.key(codes[k1][PLAYER_TUPLE_CODE], codes[k2][PLAYER_TUPLE_CODE],
+                                      vic_type_index1, vic_type_index2, seed)
+                winner = cache.get(key)
+                if winner is not None:
+                    record_result(score_board, scheduler, game, ([None, None, None, winner, "cached", seed], None), store, archive)
+                    continue
+                cache_keys[game] = key
             try:
-                g = None
-                p1_module = imp.new_module('p1_module')
-                p2_module = imp.new_module('p2_module')
-                players_lock.acquire()
-                for p in players:
-                    if (p[PLAYER_TUPLE_NAME], p[PLAYER_TUPLE_SYN]) == k1:
-                        exec(p[PLAYER_TUPLE_CODE], p1_module.__dict__)
-                    if (p[PLAYER_TUPLE_NAME], p[PLAYER_TUPLE_SYN]) == k2:
-                        exec(p[PLAYER_TUPLE_CODE], p2_module.__dict__)
-                players_lock.release()
-                g = Game(vic_type1=vic_type_index1, vic_type2=vic_type_index2)
-                if g:
-                    players_exist = True
-                    try:
-                        pp = p1_module.Player()
-                    except AttributeError as msg:
-                        players_lock.acquire()
-                        print(delete_player({"name": k1[0], "syn": k1[1]}))
-                        players_lock.release()
-                        write_to_e("No Player class.", k1, "Not started")
-                        players_exist = False
-
-                    try:
-                        pp = p2_module.Player()
-                    except AttributeError as msg:
-                        players_lock.acquire()
-                        print(delete_player({"name": k2[0], "syn": k2[1]}))
-                        players_lock.release()
-                        write_to_e("No Player class.", k2, "Not started")
-                        players_exist = False
-
-                    if players_exist:
-                        result = g.run_game(p1_module.Player(), p2_module.Player())
-                        print(result)
-                        
-                        if len(result) == 2:
-                            if result[0] == 1:
-                                players_lock.acquire()
-                                _ = delete_player({"name": k1[0], "syn": k1[1]})
-                                players_lock.release()
-                                msg = k1
-                            elif result[0] == 2: 
-                                players_lock.acquire()
-                                _ = delete_player({"name": k2[0], "syn": k2[1]})
-                                players_lock.release()
-                                msg = k2
-
-                                if result[0] == 1:
-                                    write_to_e(msg, result[1], Game.victory_types[vic_type_index1])
-                                else:
-                                    write_to_e(msg, result[1], Game.victory_types[vic_type_index2])
-                            print(msg)
-                        elif len(result) > 2:
-                            if result[-2] == 1:
-                                score_board[k1][k2][0][vic_type_index1][vic_type_index2] += 1  # win for k1
-                                score_board[k2][k1][1][vic_type_index2][vic_type_index1] += 1  # loss for k2
-                            elif result[-2] == 2:                      
-                                score_board[k1][k2][1][vic_type_index1][vic_type_index2] += 1  # loss for k1
-                                score_board[k2][k1][0][vic_type_index2][vic_type_index1] += 1  # win for k2
-                            else:                                      
-                                score_board[k1][k2][2][vic_type_index1][vic_type_index2] += 1  # draw for k1
-                                score_board[k2][k1][2][vic_type_index2][vic_type_index1] += 1  # draw for k2
+                args = (player_cache.get(k1, codes[k1][PLAYER_TUPLE_CODE], marshalled=True),
+                        player_cache.get(k2, codes[k2][PLAYER_TUPLE_CODE], marshalled=True),
+                        vic_type_index1, vic_type_index2,
+                        time_limits(k1, k2), GAME_TIME, seed)
             except Exception as msg:
-                print("Exception when trying to run a game")
+                scheduler.release(game)
+                cache_keys.pop(game, None)
+                print("Exception when trying to compile a player")
                 print(msg)
-       
-        try:
-            players_lock.release()   # safety unlock
-        except Exception:
-            pass
-
-        time.sleep(0.2)
-
-def start_server():
-        # open the socket
-    try:
-        s = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-        s.bind((HOST, PORT))
-    except socket.error as msg:
-        print('Bind failed. Error Code : {} Message {}'.format(str(msg[0]), msg[1]))
-        sys.exit()
-         
-    s.listen(10)
-    
-    start_new_thread(run_games, ())
-    
-        # load any existing players
-    for file in os.listdir(SDIR):
-        name = file[:-3]   # remove '.py'
-        i = name.rfind('_')
-        syn = name[i+1 : ]
-        name = name[ : i]
-
-        with open("{}/{}".format(SDIR,file)) as f:
+                continue
+
+            num_games += 1
+            if num_games % CACHE_REPORT_EVERY == 0:
+                print(player_cache)
+                if cache is not None:
+                    print(cache)
+                print("Ranking confidence {:.3f}".format(ratings.confidence()))
+            if num_games % PENALTY_EVERY == 0:
+                scheduler.set_penalties(turn_stats.penalties(Game.NUM_ROUNDS))
+
+            if pool is None:
+                try:
+                    remember(game, record_result(score_board, scheduler, game, play_game(*args), store, archive))
+                except Exception as msg:
+                    cache_keys.pop(game, None)
+                    scheduler.release(game)
+                    print("Exception when trying to run a game")
+                    print(msg)
+            else:
+                try:
+                    pending[pool.submit(play_game, *args)] = game
+                except Exception as msg:
+                    cache_keys.pop(game, None)
+                    scheduler.release(game)
+                    print("Exception when trying to hand a game to a worker")
+                    print(msg)
+                    if isinstance(msg, BrokenProcessPool):   # a worker died: start afresh
+                        pool.shutdown(wait=False)
+                        pool = process_pool(num_workers)
+
+        if store is not None:
+            store.flush_if_due()
+
+        idle = 0.2 if codes is synced else 0   # else go straight back to syncing
+        if pending:
+            done, _ = wait(pending, timeout=idle, return_when=FIRST_COMPLETED)
+            for future in done:
+                game = pending.pop(future)
+                remember(game, record_future(score_board, scheduler, game, future, store, archive))
+        else:
+            time.sleep(idle)
+
+        # drain: let the workers finish what they are playing, then record it
+    if pool is not None:
+        pool.shutdown(wait=True)
+    for future in as_completed(pending):
+        record_future(score_board, scheduler, pending[future], future, store, archive)
+    sandbox.close_all()
+    if store is not None:
+        store.close()
+    if archive is not None:
+        archive.close()
+    update_leader_board(score_board, lb_written, force=True)
+
+def load_players(directory, num_threads=LOAD_THREADS):
+    """add_player every name_syn.py script in directory, as saved there by add_player,
+       and compile it into player_cache, with num_threads threads.
+       @return number of players added
+    """
+    def load(file):
+        name, _, syn = file[:-3].rpartition('_')
+        with open(os.path.join(directory, file)) as f:
             d = {'name':name, 'syn':syn, 'data':f.read()}
-            msg = add_player(d)
-            print(msg)
+        msg = add_player(d, save=False)
+        if msg.startswith(b"SUCCESS"):
+            try:
+                player_cache.get((d["name"], d["syn"]), d["data"])
+            except Exception:
+                pass    # reported when it first plays, as before
+        return msg
+
+        # not .py is eg a .tmp left by a crash while persister was writing
+    files = [f for f in os.listdir(directory) if f.endswith(".py")]
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
+        msgs = list(executor.map(load, files))
+    for msg in msgs:
+        if not msg.startswith(b"SUCCESS"):
+            print(msg)     # add_player printed the others
+    return sum(msg.startswith(b"SUCCESS") for msg in msgs)
+
+def start_server(num_workers=1, num_requests=MAX_REQUESTS, num_test_workers=TEST_WORKERS, results_db=RESULTS_DB,
+                 coordinator=None, archive_dir=None):
+    """Listen for commands and run the tournament with num_workers game processes,
+       or on remote workers connecting to port coordinator if it is not None.
+       Connections are served by one asyncio thread, with at most num_requests
+       commands running at once, and at most num_test_workers TEST games.
+       Results are kept in results_db, and boards in archive_dir if not None (see run_games).
+       Ctrl-C drains the games in progress before exiting.
+    """
+    global test_jobs, player_cache
+    if coordinator is not None:
+        try:
+            read_secret(COORDINATOR_SECRET)   # fail now, not later in run_games
+        except (OSError, ValueError) as msg:
+            print("Cannot coordinate workers without a secret: {}".format(msg))
+            return
+    test_jobs = JobQueue(num_test_workers, TEST_QUEUE)
+    player_cache = PlayerCache(directory=PYC_DIR)
+
+        # load any existing players, before run_games so their results are restored
+    start = time.perf_counter()
+    n = load_players(SDIR)
+    print("Loaded {} players in {:.2f}s, deleted {} unused compiled scripts".format(
+          n, time.perf_counter() - start, player_cache.prune()))
+
+    games_thread = Thread(target=run_games, args=(num_workers, results_db, coordinator, archive_dir))
+    games_thread.start()
         
         # loop listening for connections.
-    while True:
-        conn, addr = s.accept()
-        print('Connected with {} {}'.format(addr[0], addr[1]))
-        start_new_thread(clientthread ,(conn,))
-    
-        players_lock.acquire()
-        print("********************** {}".format(len(players)))
-        print("\n".join([t[0] for t in players]))
-        players_lock.release()
-
-        time.sleep(0.1)
-
-start_server()
-
-###################################################
-# Test run_games()
-###################################################
-#    # dummy player for testing 
-#p = """ 
-#class Player:
-#    def __init__(self): pass
-#    def take_turn(self, data, victory): return {k:1.1 for k in data}
-#    def __repr__(self): return "Always 1.1"
-#"""
-#players.append(("T1", 1, p, 0, 0)) 
-#players.append(("T2", 2, p, 0, 0)) 
-#players.append(("T3", 2, p, 0, 0)) 
-#
-#run_games()
+    try:
+        asyncio.run(serve(num_requests))
+    except OSError as msg:
+        print('Bind failed. Error: {}'.format(msg))
+    except KeyboardInterrupt:
+        pass
+    print("Draining games...")
+    test_jobs.shutdown()
+    drain_games()
+    games_thread.join()
+    persister.close()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the tournament server.")
+    parser.add_argument("--workers", type=int, default=1, 
+                        help="number of processes playing games in parallel (default 1, no pool)")
+    parser.add_argument("--lb-interval", type=float, default=LB_INTERVAL,
+                        help="minimum seconds between leader board writes (default {})".format(LB_INTERVAL))
+    parser.add_argument("--max-requests", type=int, default=MAX_REQUESTS,
+                        help="commands run at once, more connections wait (default {})".format(MAX_REQUESTS))
+    parser.add_argument("--test-workers", type=int, default=TEST_WORKERS,
+                        help="TEST games run at once (default {})".format(TEST_WORKERS))
+    parser.add_argument("--results", default=RESULTS_DB,
+                        help="SQLite file keeping results across restarts (default {})".format(RESULTS_DB))
+    parser.add_argument("--game-time", type=float, default=GAME_TIME,
+                        help="seconds of take_turn a player gets over a game (default {})".format(GAME_TIME))
+    parser.add_argument("--fixed-time", action="store_true",
+                        help="always allow {}s a turn, rather than tightening it from each player's turn times".format(Game.TIME))
+    parser.add_argument("--seeds", type=int, default=SEEDS,
+                        help="play each pairing with only this many seeds, and skip replaying games "
+                             "of deterministic players (default {}, every game random)".format(SEEDS))
+    parser.add_argument("--schedule", choices=["exhaustive", "rating"], default=SCHEDULE,
+                        help="exhaustive: play every pairing and victory types equally, rating: play the games "
+                             "that most improve the ratings, and rank by rating (default {})".format(SCHEDULE))
+    parser.add_argument("--archive", metavar="DIR",
+                        help="keep every finished board in a compressed archive in DIR (see archive.py)")
+    parser.add_argument("--coordinator", type=int, metavar="PORT",
+                        help="play games on workers (distributed.py) connecting to PORT, not --workers processes")
+    parser.add_argument("--coordinator-host", default=COORDINATOR_HOST,
+                        help="interface --coordinator listens on (default {})".format(COORDINATOR_HOST))
+    parser.add_argument("--secret", default=COORDINATOR_SECRET,
+                        help="file of the secret workers must know for --coordinator (default {})".format(COORDINATOR_SECRET))
+    args = parser.parse_args()
+    LB_INTERVAL = args.lb_interval
+    GAME_TIME = args.game_time
+    SEEDS = args.seeds
+    SCHEDULE = args.schedule
+    ADAPTIVE_TIME = not args.fixed_time
+    COORDINATOR_HOST = args.coordinator_host
+    COORDINATOR_SECRET = args.secret
+    start_server(args.workers, args.max_requests, args.test_workers, args.results, args.coordinator, args.archive)
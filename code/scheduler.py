@@ -0,0 +1,206 @@
+"""
+    Choose the least played game of the tournament without scanning the score board.
+
+    A game is a cell (key1, key2, index1, index2): player key1 = (name, syn)
+    with victory type Game.victory_types[index1] against key2 with index2.
+    Every cell that is not being played sits in a heap ordered by the
+    number of times it has been played, so choosing is a pop and recording
+    a result is a push. A result counts for both (key1, key2, index1, index2)
+    and its mirror (key2, key1, index2, index1), as on the score board, so
+    the mirror's old heap entry goes stale and is skipped when popped.
+
+    Slow players can be given a penalty p >= 1 with set_penalties(), which
+    orders their cells by (games played + 1) * p, so they come up about p
+    times less often than other players' cells.
+
+    With many players, sync() can add them a few at a time so that
+    games start before every player's cells exist.
+
+    RatedScheduler instead plays the pairs whose games say most about the
+    ranking, from players' ratings (see ratings.py).
+"""
+import heapq
+import itertools
+import time
+import numpy as np
+
+class Scheduler:
+    def __init__(self, num_vic_types):
+        self.num_vic_types = num_vic_types
+        self.heap = []           # (priority, tie break, cell, games played), may hold stale entries
+        self.counts = {}         # cell: games played
+        self.in_flight = set()   # cells chosen but not yet recorded or released
+        self.players = set()
+        self.penalties = {}      # key: penalty > 1 of a slow player
+        self.order = itertools.count()
+
+    def cells(self, k1, k2):
+        """All the cells for k1 playing k2."""
+        n = range(self.num_vic_types)
+        return [(k1, k2, i1, i2) for i1 in n for i2 in n]
+
+    def priority(self, cell):
+        n = self.counts[cell] + 1
+        if self.penalties:
+            n *= max(self.penalties.get(cell[0], 1), self.penalties.get(cell[1], 1))
+        return n
+
+    def push(self, cell):
+        heapq.heappush(self.heap, (self.priority(cell), next(self.order), cell, self.counts[cell]))
+
+    def set_penalties(self, penalties):
+        """Set penalties, a dict of key: penalty > 1, replacing any before.
+           O(number of cells) when they change, so call it every so often, not every game.
+        """
+        penalties = {k:p for k,p in penalties.items() if k in self.players}
+        if penalties == self.penalties:
+            return
+        self.penalties = penalties
+        self.heap = [(self.priority(c), next(self.order), c, n) for c,n in self.counts.items() if c not in self.in_flight]
+        heapq.heapify(self.heap)
+
+    def add_player(self, k, score_board=None):
+        """Add the cells of player k = (name, syn) against every player of another syndicate.
+           Counts start from score_board (a ScoreBoard) if it has them.
+        """
+        if k in self.players:
+            return
+        for k2 in self.players:
+            if k2[1] == k[1]:
+                continue
+            for a, b in [(k, k2), (k2, k)]:
+                games = None
+                if score_board is not None and a in score_board and b in score_board:
+                    games = score_board.games(a, b)
+                for cell in self.cells(a, b):
+                    self.counts[cell] = 0 if games is None else int(games[cell[2], cell[3]])
+                    self.push(cell)
+        self.players.add(k)
+
+    def remove_player(self, k):
+        """Remove every cell of player k. O(number of cells), but deletes are rare."""
+        if k not in self.players:
+            return
+        self.players.discard(k)
+        self.penalties.pop(k, None)
+        self.heap = [e for e in self.heap if k not in e[2][:2]]
+        heapq.heapify(self.heap)
+        self.counts = {c:n for c,n in self.counts.items() if k not in c[:2]}
+        self.in_flight = {c for c in self.in_flight if k not in c[:2]}
+
+    def sync(self, keys, score_board=None, budget=None):
+        """Add and remove players so the scheduler has exactly keys, adding players
+           in the order of keys only until budget seconds have gone if it is not None.
+           A player's cells cost O(players), so with hundreds of players a full sync
+           takes seconds. Games can be chosen among the players added so far.
+           @return True if the scheduler has exactly keys
+        """
+        start = time.perf_counter()
+        wanted = set(keys)
+        for k in self.players - wanted:
+            self.remove_player(k)
+        for k in keys:
+            if budget is not None and time.perf_counter() - start > budget:
+                return False
+            self.add_player(k, score_board)
+        return True
+
+    def choose(self):
+        """Return the least played cell, which is in flight until record() or release().
+           (None, None, None, None) if every cell is in flight or there are none.
+        """
+        while self.heap:
+            _, _, cell, n = heapq.heappop(self.heap)
+            if cell not in self.in_flight and self.counts.get(cell) == n:
+                self.in_flight.add(cell)
+                return cell
+        return (None, None, None, None)
+
+    def record(self, cell):
+        """A game for cell was played."""
+        k1, k2, i1, i2 = cell
+        for c in [cell, (k2, k1, i2, i1)]:
+            if c in self.counts:
+                self.counts[c] += 1
+                if c not in self.in_flight:
+                    self.push(c)
+        self.release(cell)
+
+    def release(self, cell):
+        """A game for cell was chosen but not played."""
+        if cell in self.in_flight:
+            self.in_flight.discard(cell)
+            self.push(cell)
+
+class RatedScheduler(Scheduler):
+    """Scheduler that plays the most informative pair next rather than the least played cell.
+
+       The pair is the one whose next game is expected to shrink the two players'
+       rating variances most (see Ratings.information), divided by 1 + its games
+       in flight and by the larger penalty of the two. Of that pair's cells, in
+       either order, the least played one not in flight is chosen, so victory
+       types still take turns. The pair's score is one numpy array over all
+       players, so choosing is O(players squared) but cheap.
+
+       ratings is a Ratings, which record_result updates with every result.
+    """
+
+    def __init__(self, num_vic_types, ratings):
+        super().__init__(num_vic_types)
+        self.ratings = ratings
+        self.busy = {}   # frozenset of 2 keys: games of the pair in flight
+
+    def push(self, cell):
+        pass         # choose() reads counts directly, so there is no heap
+
+    def set_penalties(self, penalties):
+        self.penalties = {k:p for k,p in penalties.items() if k in self.players}
+
+    def add_player(self, k, score_board=None):
+        super().add_player(k, score_board)
+        self.ratings.add(k)
+
+    def remove_player(self, k):
+        super().remove_player(k)
+        self.busy = {p:n for p,n in self.busy.items() if k not in p}
+
+    def choose(self):
+        keys = sorted(self.players, key=repr)   # names may be str or int (a syn, if ADD had no name)
+        if len(keys) < 2:
+            return (None, None, None, None)
+        score = self.ratings.information(keys)
+        syn = np.array([k[1] for k in keys], dtype=object)
+        score[syn[:, None] == syn[None, :]] = -np.inf
+        score[np.tril_indices(len(keys))] = -np.inf
+        index = {k:i for i,k in enumerate(keys)}
+        for pair, n in self.busy.items():
+            i, j = sorted(index[k] for k in pair)
+            score[i, j] /= 1 + n
+        if self.penalties:
+            p = np.array([self.penalties.get(k, 1) for k in keys])
+            score /= np.maximum(p[:, None], p[None, :])
+
+        full = 2 * self.num_vic_types ** 2
+        while True:
+            i, j = np.unravel_index(np.argmax(score), score.shape)
+            if score[i, j] == -np.inf:
+                return (None, None, None, None)
+            k1, k2 = keys[i], keys[j]
+            if self.busy.get(frozenset((k1, k2)), 0) < full:
+                break
+            score[i, j] = -np.inf
+
+        cells = [c for c in self.cells(k1, k2) + self.cells(k2, k1) if c not in self.in_flight]
+        cell = min(cells, key=lambda c: self.counts[c])
+        self.in_flight.add(cell)
+        pair = frozenset(cell[:2])
+        self.busy[pair] = self.busy.get(pair, 0) + 1
+        return cell
+
+    def release(self, cell):
+        if cell in self.in_flight:
+            self.in_flight.discard(cell)
+            pair = frozenset(cell[:2])
+            self.busy[pair] -= 1
+            if self.busy[pair] == 0:
+                del self.busy[pair]
@@ -0,0 +1,103 @@
+"""
+    Wins, losses and draws of every pair of players, for every pair of victory types.
+
+    Counts live in one tensor indexed [slot1, slot2, WIN/LOSS/DRAW, vt1, vt2],
+    where slot1 is the player key1 = (name, syn) whose result it is, against
+    key2 when key1 had victory type vt1 and key2 had vt2. Slots of deleted
+    players are reused, and the tensor doubles when it runs out, so memory
+    only depends on the most players ever in the tournament at once.
+    Counts are int32, which no pair's games come near, to halve that memory.
+
+    Each player's totals over all opponents are kept as results are recorded,
+    so the leader board costs O(players) to read. version changes whenever
+    the results do.
+"""
+import numpy as np
+
+WIN = 0
+LOSS = 1
+DRAW = 2
+
+class ScoreBoard:
+    def __init__(self, num_vic_types, capacity=16):
+        self.num_vic_types = num_vic_types
+        self.tensor = np.zeros((capacity, capacity, 3, num_vic_types, num_vic_types), dtype=np.int32)
+        self.running = np.zeros((capacity, 3, num_vic_types, num_vic_types), dtype=np.int32)  # sum over slot2
+        self.version = 0
+        self.slots = {}                            # (name, syn): slot
+        self.free = list(range(capacity - 1, -1, -1))   # unused slots, next one last
+
+    def __contains__(self, k):
+        return k in self.slots
+
+    def __len__(self):
+        return len(self.slots)
+
+    def keys(self):
+        """Player keys in the order they were added."""
+        return list(self.slots)
+
+    def add(self, k):
+        """Give player k a slot with no games."""
+        if k in self.slots:
+            return
+        if not self.free:
+            n = self.tensor.shape[0]
+            bigger = np.zeros((2 * n, 2 * n) + self.tensor.shape[2:], dtype=self.tensor.dtype)
+            bigger[:n, :n] = self.tensor
+            self.tensor = bigger
+            self.running = np.concatenate([self.running, np.zeros_like(self.running)])
+            self.free = list(range(2 * n - 1, n - 1, -1))
+        s = self.free.pop()
+        self.tensor[s, :] = 0
+        self.tensor[:, s] = 0
+        self.running[s] = 0
+        self.slots[k] = s
+        self.version += 1
+
+    def remove(self, k):
+        """Forget player k and its games."""
+        s = self.slots.pop(k, None)
+        if s is not None:
+            self.free.append(s)
+            self.running[self.active()] -= self.tensor[self.active(), s]
+            self.version += 1
+
+    def record(self, k1, k2, vic_type_index1, vic_type_index2, winner, n=1):
+        """Count n games of k1 (as player 1) vs k2, winner 0 for draw, else 1 or 2."""
+        s1, s2 = self.slots[k1], self.slots[k2]
+        if winner == 1:
+            r1, r2 = WIN, LOSS
+        elif winner == 2:
+            r1, r2 = LOSS, WIN
+        else:
+            r1 = r2 = DRAW
+        self.tensor[s1, s2, r1, vic_type_index1, vic_type_index2] += n
+        self.tensor[s2, s1, r2, vic_type_index2, vic_type_index1] += n
+        self.running[s1, r1, vic_type_index1, vic_type_index2] += n
+        self.running[s2, r2, vic_type_index2, vic_type_index1] += n
+        self.version += 1
+
+    def pair(self, k1, k2):
+        """Array [WIN/LOSS/DRAW, vt1, vt2] of k1's results against k2 (a view, don't change it)."""
+        return self.tensor[self.slots[k1], self.slots[k2]]
+
+    def games(self, k1, k2):
+        """Array [vt1, vt2] of how many games k1 and k2 have played."""
+        return self.pair(k1, k2).sum(axis=0)
+
+    def player(self, k):
+        """Array [WIN/LOSS/DRAW, vt1, vt2] of k's results against everyone."""
+        return self.running[self.slots[k]]
+
+    def active(self):
+        """Slots in use, in the order of keys()."""
+        return np.fromiter(self.slots.values(), dtype=int, count=len(self.slots))
+
+    def totals(self):
+        """Return dict of key: array [wins, losses, draws] over all games."""
+        return dict(zip(self.slots, self.running[self.active()].sum(axis=(2, 3))))
+
+    def win_loss_ratios(self):
+        """Return dict of key: wins / losses, counting no losses as 0.1."""
+        return {k:t[WIN] / (t[LOSS] if t[LOSS] > 0 else 0.1) for k,t in self.totals().items()}
@@ -0,0 +1,97 @@
+"""
+    Keep every tournament result in SQLite so a restarted server picks up
+    where it left off instead of replaying the round robin.
+
+    Results are appended to a log table in batches. Every so often the log
+    is compacted into a snapshot table of counts per (player1, player2, vt1,
+    vt2, winner), so loading is one small aggregate query however many games
+    have been played. A crash loses at most the batch not yet committed,
+    which is at most FLUSH_INTERVAL seconds old as long as flush_if_due()
+    is called regularly.
+"""
+import sqlite3
+import time
+
+BATCH = 100             # results per commit
+FLUSH_INTERVAL = 5      # most seconds a result waits to be committed
+COMPACT_EVERY = 10000   # log rows before they are folded into the snapshot
+
+COLUMNS = "name1, syn1, name2, syn2, vt1, vt2, winner"
+
+class ResultStore:
+    def __init__(self, path):
+        """Open (or create) the store in file path. Use from one thread only."""
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS results ({})".format(COLUMNS))
+        self.db.execute("CREATE TABLE IF NOT EXISTS snapshot ({}, n INTEGER, PRIMARY KEY ({}))".format(COLUMNS, COLUMNS))
+        self.db.commit()
+        self.pending = []
+        self.flushed = time.time()
+        self.log_rows = self.db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def record(self, k1, k2, vic_type_index1, vic_type_index2, winner):
+        """Add the result of k1 (as player 1) vs k2, winner 0 for draw, else 1 or 2."""
+        self.pending.append((k1[0], k1[1], k2[0], k2[1], vic_type_index1, vic_type_index2, winner))
+        if len(self.pending) >= BATCH:
+            self.flush()
+        else:
+            self.flush_if_due()
+
+    def flush_if_due(self):
+        """flush() if a pending result has waited FLUSH_INTERVAL seconds. Call this
+           regularly, so results are committed in a quiet spell too.
+        """
+        if self.pending and time.time() - self.flushed > FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        """Commit pending results, compacting the log if it is long."""
+        if self.pending:
+            with self.db:
+                self.db.executemany("INSERT INTO results VALUES (?,?,?,?,?,?,?)", self.pending)
+            self.log_rows += len(self.pending)
+            self.pending = []
+        self.flushed = time.time()
+        if self.log_rows >= COMPACT_EVERY:
+            self.compact()
+
+    def compact(self):
+        """Fold the log into the snapshot."""
+        with self.db:
+            self.db.execute("""INSERT INTO snapshot SELECT {0}, COUNT(*) FROM results WHERE true GROUP BY {0}
+                               ON CONFLICT ({0}) DO UPDATE SET n = n + excluded.n""".format(COLUMNS))
+            self.db.execute("DELETE FROM results")
+        self.log_rows = 0
+
+    def forget(self, k):
+        """Delete every result of player k = (name, syn), eg when it is deleted."""
+        self.flush()
+        with self.db:
+            for table in ["results", "snapshot"]:
+                self.db.execute("DELETE FROM {} WHERE (name1 = ? AND syn1 = ?) OR (name2 = ? AND syn2 = ?)".format(table),
+                                (k[0], k[1], k[0], k[1]))
+
+    def counts(self):
+        """Return list of (k1, k2, vt1, vt2, winner, number of games) for all results."""
+        self.flush()
+        rows = self.db.execute("""SELECT {0}, SUM(n) FROM
+                                  (SELECT {0}, n FROM snapshot UNION ALL SELECT {0}, 1 FROM results)
+                                  GROUP BY {0}""".format(COLUMNS))
+        return [((r[0], r[1]), (r[2], r[3]), r[4], r[5], r[6], r[7]) for r in rows]
+
+    def load(self, score_board):
+        """Add the stored results to score_board (a ScoreBoard) for players it has.
+           @return number of games loaded
+        """
+        n = 0
+        for k1, k2, vt1, vt2, winner, count in self.counts():
+            if k1 in score_board and k2 in score_board:
+                score_board.record(k1, k2, vt1, vt2, winner, count)
+                n += count
+        return n
+
+    def close(self):
+        self.flush()
+        self.db.close()
@@ -0,0 +1,38 @@
+"""
+    RemotePool's bookkeeping of games as workers come and go, without real workers.
+
+    Run with: python -m pytest test_distributed.py
+"""
+import socket
+from distributed import RemotePool, RemoteWorker
+
+def worker(pool, slots=1):
+    """A RemoteWorker joined to pool, whose messages go to a socket nobody reads."""
+    sock, other = socket.socketpair()
+    w = RemoteWorker(sock, ("test", 0), slots)
+    w.other = other   # kept open so sends succeed
+    with pool.cond:
+        pool.workers.add(w)
+        sends = pool.dispatch()
+    pool.send_all(sends)
+    return w
+
+def test_late_result_of_lost_worker():
+    pool = RemotePool("localhost", 0, b"secret")
+    try:
+        w = worker(pool)
+        future = pool.submit(None, b"code1", b"code2", 0, 1)
+        assert w.games == {0}
+        pool.lost(w)                  # eg it went quiet, so the game is queued again
+        assert list(pool.queue) == [0]
+        outcome = [[None, None, None, 1, "gg", 7], None]
+        pool.finish(w, {"type": "result", "id": 0, "outcome": outcome})   # but its result arrives
+        assert future.result(0) == tuple(outcome)
+        assert not pool.queue
+
+        w2 = worker(pool)             # a new worker is given nothing, and no error
+        assert not w2.games
+        pool.submit(None, b"code1", b"code2", 2, 3)
+        assert w2.games == {1}
+    finally:
+        pool.shutdown(wait=False)
@@ -0,0 +1,70 @@
+"""
+    Round trips of requests and replies through framing.py, as sandpit.py reads and answers them.
+
+    Run with: python -m pytest test_framing.py
+"""
+import asyncio
+import json
+import socket
+import pytest
+import framing
+
+MAX = 2**20
+
+def read(*chunks, max_size=MAX):
+    """read_message of a connection that receives chunks, one read at a time, then closes."""
+    async def go():
+        reader = asyncio.StreamReader()
+        for c in chunks:
+            reader.feed_data(c)
+        reader.feed_eof()
+        return await framing.read_message(reader, max_size, chunk_size=3)
+    return asyncio.run(go())
+
+def request(text):
+    return json.dumps({"cmd": "ADD", "name": "Zoë", "data": text}, ensure_ascii=False).encode('utf-8')
+
+def test_legacy():
+    payload = request("x = 1")
+    assert read(payload + framing.EOM) == (payload, None)
+    assert framing.reply(b"SUCCESS\n", None) == b"SUCCESS\n"
+
+def test_framed():
+    payload = request("x = 1")
+    frame = framing.encode(payload, framing.ACCEPT_COMPRESSED)
+    assert read(frame) == (payload, framing.ACCEPT_COMPRESSED)
+
+def test_compressed():
+    payload = request("x = 1\n" * 2000)
+    frame = framing.encode(payload, framing.ACCEPT_COMPRESSED, compress=True)
+    assert len(frame) < len(payload)
+    assert read(frame) == (payload, framing.ACCEPT_COMPRESSED | framing.COMPRESSED)
+
+    reply = framing.reply(payload, framing.ACCEPT_COMPRESSED)
+    flags, length = framing.parse_header(reply[:framing.HEADER.size], MAX)
+    assert flags & framing.COMPRESSED
+    assert framing.decode(reply[framing.HEADER.size:], flags, MAX) == payload
+
+def test_split_utf8():
+    payload = request("s = 'é€😀'")
+    cut = payload.index("é".encode('utf-8')) + 1    # part way through the character
+    for msg, flags in [(payload + framing.EOM, None), (framing.encode(payload), 0)]:
+        data, got = read(msg[:cut + 5], msg[cut + 5:])
+        assert got == flags
+        assert data.decode('utf-8') == payload.decode('utf-8')
+
+def test_too_long():
+    with pytest.raises(framing.FrameError):
+        read(framing.encode(b"x" * 100), max_size=50)
+    with pytest.raises(framing.FrameError):
+        read(framing.encode(b"x" * 10000, compress=True), max_size=5000)
+
+def test_socket_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        payload = request("x = 1\n" * 2000)
+        framing.send_frame(a, payload)
+        flags, length = framing.parse_header(framing.recv_exactly(b, framing.HEADER.size), MAX)
+        assert framing.decode(framing.recv_exactly(b, length), flags, MAX) == payload
+        b.sendall(framing.reply(payload, flags))
+        assert framing.recv_frame(a) == payload
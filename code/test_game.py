@@ -0,0 +1,69 @@
+"""
+    Check the faster victory checks against Game.check_condition, the reference.
+
+    Run with: python -m pytest test_game.py
+"""
+import numpy as np
+from game import Game
+from conditions import RunningConditions
+
+NUM_COLS = 5
+
+def boards(num_boards, num_rows, seed=0):
+    """num_boards random (columns, rows) boards of rounded floats, some of them with
+       ties, constant columns, or columns that rise linearly or quadratically.
+    """
+    rng = np.random.default_rng(seed)
+    out = []
+    for i in range(num_boards):
+        b = np.round(rng.uniform(-10, 10, (NUM_COLS, num_rows)), 5)
+        kind = i % 5
+        if kind == 1:     # ties, so fewer values are unique
+            b = np.round(b / 5)
+        elif kind == 2:   # rising lines, with noise
+            b += np.arange(num_rows) * rng.uniform(0, 5, (NUM_COLS, 1))
+        elif kind == 3:   # rising curves
+            b = np.round(np.arange(num_rows) ** 2 * rng.uniform(0, 1, (NUM_COLS, 1)) + rng.uniform(-1, 1, b.shape), 5)
+        elif kind == 4:   # a constant column and one summing to zero
+            b[0] = b[0, 0]
+            b[1] = 0.0
+        out.append(b)
+    return out
+
+def game(vic_type, vic_col):
+    """A Game whose first player has victory vic_type on column vic_col (an index)."""
+    g = Game(num_cols=NUM_COLS, vic_type1=Game.victory_types.index(vic_type), seed=1)
+    g.vic_cols[0] = g.col_names[vic_col]
+    return g
+
+def test_check_condition_batch():
+    bs = boards(200, 21)
+    for vt in Game.victory_types:
+        for j in range(NUM_COLS):
+            g = game(vt, j)
+            expected = [bool(g.check_condition({k:b[c].tolist() for c,k in enumerate(g.col_names)}, 0)) for b in bs]
+            assert Game.check_condition_batch(bs, vt, j).tolist() == expected, (vt, j)
+
+def test_running_conditions():
+    games = {(vt, j): game(vt, j) for vt in Game.victory_types for j in range(NUM_COLS)}
+    col_names = games["Max", 0].col_names
+    for b in boards(60, 21, seed=1):
+        rc = RunningConditions(col_names, capacity=4)   # so it has to grow
+        for n in range(1, b.shape[1] + 1):
+            rc.add(b[:, n - 1])
+            data = {k:b[c, :n].tolist() for c,k in enumerate(col_names)}
+            for (vt, j), g in games.items():
+                if vt in ("Linear", "Quadratic") and n < 2:
+                    continue    # stats.pearsonr needs two values
+                assert rc.check(vt, col_names[j]) == bool(g.check_condition(data, 0)), (vt, j, n)
+
+class Constant:
+    def __init__(self, value):
+        self.value = value
+
+    def take_turn(self, data, victory):
+        return {k:self.value for k in data}
+
+def test_run_game_rounds_as_builtin_round():
+    board = Game(num_rounds=1, seed=1).run_game(Constant(1.000005), Constant(0.123455))[0]
+    assert list(board.values())[0] == [0.0, round(1.000005, 5), round(0.123455, 5)]
@@ -0,0 +1,309 @@
+"""
+    Run a tournament offline, with no server or sockets, and report how fast it went.
+
+    python tournament.py bots                      # round robin of the reference bots
+    python tournament.py mbusa --games 500 --workers 4 --json bench.jsonl
+    python tournament.py --micro 60                # choose_game and leader board, 60 players
+    python tournament.py --converge 30             # games to rank 30 players, by schedule
+
+    Player scripts are read from a directory of name_syn.py files, as kept
+    by sandpit.py in SDIR. A round robin plays every pair of players once
+    for every pair of victory types. The report gives games per second,
+    percentiles of take_turn latency and where the time went (exec of the
+    scripts, take_turn, validating rows and check_condition). --json appends
+    the report as one line to a file, to track performance over time.
+
+    --converge plays no real games. Players get hidden strengths and games
+    are decided by them, so it measures how many games each schedule needs
+    before its ranking (win-loss ratio for exhaustive, rating for rating)
+    agrees with the true one to --target Kendall's tau.
+"""
+from game import Game
+from player_cache import PlayerCache
+from scheduler import Scheduler, RatedScheduler
+from ratings import Ratings
+from scoreboard import ScoreBoard, WIN, LOSS, DRAW
+import sandbox
+import sandpit
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+import argparse
+import json
+import marshal
+import multiprocessing as mp
+import os
+import random
+import tempfile
+import time
+import types
+import numpy as np
+from scipy import stats
+
+PHASES = ["exec", "take_turn", "validate", "check_condition"]
+
+def load_players(directory):
+    """Return list of (name, syn, script) for each name_syn.py file in directory.
+       Files not named that way get a syndicate number of their own.
+    """
+    players = []
+    files = sorted(f for f in os.listdir(directory) if f.endswith(".py"))
+    for i, file in enumerate(files):
+        name = file[:-3]
+        name, _, syn = name.rpartition('_')
+        if not name or not syn.isdigit():
+            name, syn = file[:-3], 1000 + i
+        with open(os.path.join(directory, file)) as f:
+            players.append((name, int(syn), f.read()))
+    return players
+
+def timed_game(code1, code2, vic_type_index1, vic_type_index2, sandboxed=True):
+    """Play one game as sandpit.play_game does, with marshalled code from PlayerCache.
+       sandboxed - run players in sandbox processes, else exec them in this process
+       @return (result, times) where times has seconds for each of PHASES and
+               "turns", a list of the time of every take_turn.
+    """
+    start = time.perf_counter()
+    if sandboxed:
+        players = [sandbox.player_process(code1).player(1), sandbox.player_process(code2).player(2)]
+    else:
+        players = []
+        for code in (code1, code2):
+            module = types.ModuleType('player_module')
+            exec(marshal.loads(code), module.__dict__)
+            players.append(module.Player())
+    exec_time = time.perf_counter() - start
+
+    g = Game(vic_type1=vic_type_index1, vic_type2=vic_type_index2)
+    result = g.run_game(*players)
+    if len(result) == 2:
+        result = (result[0], str(result[1]))
+    times = dict(g.timings, exec=exec_time, turns=g.turn_times[0] + g.turn_times[1])
+    return result, times
+
+def run(players, num_games=None, num_workers=1, sandboxed=True):
+    """Play num_games games (None for a round robin) of players, a list of
+       (name, syn, script), chosen by the tournament Scheduler.
+       @return report dictionary
+    """
+    n = len(Game.victory_types)
+    score_board = ScoreBoard(n)
+    scheduler = Scheduler(n)
+    cache = PlayerCache()
+    codes = {}
+    for name, syn, code in players:
+        codes[(name, syn)] = code
+        score_board.add((name, syn))
+    scheduler.sync(codes.keys())
+    if num_games is None:
+        num_games = len(scheduler.counts) // 2   # a game counts for a cell and its mirror
+
+    pool = None
+    if num_workers > 1:   # forkserver, as in sandpit.process_pool
+        pool = ProcessPoolExecutor(max_workers=num_workers, mp_context=mp.get_context("forkserver"))
+    pending = {}
+    phases = dict.fromkeys(PHASES, 0.0)
+    turns = []
+    failures = 0
+    schedule_time = 0.0
+    started = done = 0
+
+    def record(game, result, times):
+        nonlocal failures, schedule_time, done
+        done += 1
+        for p in PHASES:
+            phases[p] += times[p]
+        turns.extend(times["turns"])
+        start = time.perf_counter()
+        scheduler.record(game)   # even a failed game, or a broken bot would be chosen for ever
+        schedule_time += time.perf_counter() - start
+        if len(result) == 2:
+            failures += 1
+            print("{} failed: {}".format(game[result[0] - 1], result[1]))
+        else:
+            score_board.record(*game, result[3])
+
+    wall = time.perf_counter()
+    while done < num_games:
+        while started < num_games and len(pending) < max(num_workers, 1):
+            start = time.perf_counter()
+            game = scheduler.choose()
+            schedule_time += time.perf_counter() - start
+            if game[0] is None:
+                num_games = started
+                break
+            started += 1
+            args = (cache.get(game[0], codes[game[0]], marshalled=True),
+                    cache.get(game[1], codes[game[1]], marshalled=True),
+                    game[2], game[3], sandboxed)
+            if pool is None:
+                record(game, *timed_game(*args))
+            else:
+                pending[pool.submit(timed_game, *args)] = game
+        if pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                record(pending.pop(future), *future.result())
+    wall = time.perf_counter() - wall
+
+    if pool is not None:
+        pool.shutdown(wait=True)
+    sandbox.close_all()
+
+    turns = np.array(turns) * 1000
+    totals = score_board.totals()
+    return {
+        "players": len(players), "games": done, "failures": failures,
+        "workers": num_workers, "sandboxed": sandboxed,
+        "seconds": wall, "games_per_sec": done / wall if wall > 0 else 0.0,
+        "turn_ms": {q: float(np.percentile(turns, q)) if len(turns) else 0.0 for q in [50, 95, 99, 100]},
+        "phase_seconds": phases,
+        "choose_game_us": 1e6 * schedule_time / max(done, 1),
+        "standings": sorted([[k[0], k[1], int(t[WIN]), int(t[LOSS]), int(t[DRAW])] for k,t in totals.items()],
+                            key=lambda r: -r[2]),
+    }
+
+def micro(num_players, num_games=10000, repeats=5):
+    """Time choose_game and the leader board on a synthetic tournament of num_players.
+       @return report dictionary
+    """
+    n = len(Game.victory_types)
+    score_board = ScoreBoard(n)
+    scheduler = Scheduler(n)
+    for i in range(num_players):
+        score_board.add(("P{}".format(i), i))
+
+    start = time.perf_counter()
+    scheduler.sync(score_board.keys(), score_board)
+    sync_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for _ in range(num_games):
+        game = sandpit.choose_game(scheduler)
+        scheduler.record(game)
+        score_board.record(*game, random.randint(0, 2))
+    choose_time = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as tmp:
+        sandpit.LB_FILE, sandpit.LB_JSON, sandpit.LB_CSV = [os.path.join(tmp, f) for f in ["lb.html", "lb.json", "lb.csv"]]
+        start = time.perf_counter()
+        for _ in range(repeats):
+            sandpit.print_leader_board(score_board)
+            sandpit.export_leader_board(score_board)
+        lb_time = (time.perf_counter() - start) / repeats
+
+    return {"players": num_players, "games": num_games,
+            "sync_ms": 1000 * sync_time,
+            "choose_game_us": 1e6 * choose_time / num_games,
+            "leader_board_ms": 1000 * lb_time}
+
+def games_to_rank(schedule, strengths, target, max_games, rng, draw=0.1):
+    """Play synthetic games chosen by schedule ("exhaustive" or "rating") between players
+       of hidden Elo strengths until the ranking reaches Kendall's tau target against them.
+       @return (games played, ranking confidence of the ratings then), games None if max_games
+               weren't enough
+    """
+    n = len(Game.victory_types)
+    keys = [("P{}".format(i), i) for i in range(len(strengths))]
+    strength = dict(zip(keys, strengths))
+    score_board = ScoreBoard(n)
+    ratings = Ratings()
+    for k in keys:
+        score_board.add(k)
+        ratings.add(k)
+    scheduler = RatedScheduler(n, ratings) if schedule == "rating" else Scheduler(n)
+    scheduler.sync(keys)
+
+    for games in range(1, max_games + 1):
+        game = scheduler.choose()
+        k1, k2 = game[:2]
+        p1 = (1 - draw) / (1 + 10 ** ((strength[k2] - strength[k1]) / 400))
+        u = rng.random()
+        winner = 1 if u < p1 else (0 if u < p1 + draw else 2)
+        scheduler.record(game)
+        score_board.record(*game, winner)
+        ratings.record(k1, k2, winner)
+        if games % len(keys) == 0:
+            if schedule == "rating":
+                ranking = ratings.ranking()
+            else:
+                wl = score_board.win_loss_ratios()
+                ranking = sorted(keys, key=lambda k: wl[k], reverse=True)
+            tau = stats.kendalltau([strength[k] for k in ranking], range(len(keys), 0, -1))[0]
+            if tau >= target:
+                return games, ratings.confidence()
+    return None, ratings.confidence()
+
+def converge(num_players, target=0.9, trials=5, spread=200, seed=0):
+    """Compare games each schedule needs to rank num_players of Elo strengths drawn from
+       N(1500, spread) to Kendall's tau target, in trials tournaments.
+       @return report dictionary
+    """
+    n = len(Game.victory_types)
+    round_robin = num_players * (num_players - 1) * n * n // 2   # a game counts for a cell and its mirror
+    report = {"players": num_players, "target_tau": target, "round_robin": round_robin}
+    for schedule in ["exhaustive", "rating"]:
+        rng = random.Random(seed)
+        games, confidence = [], []
+        start = time.perf_counter()
+        for _ in range(trials):
+            strengths = [rng.gauss(1500, spread) for _ in range(num_players)]
+            g, c = games_to_rank(schedule, strengths, target, 5 * round_robin, rng)
+            games.append(g if g is not None else float("inf"))
+            confidence.append(c)
+        report[schedule] = {"median_games": float(np.median(games)), "games": games,
+                            "confidence": float(np.mean(confidence)),
+                            "seconds": time.perf_counter() - start}
+    return report
+
+def print_report(report):
+    """Print a report from run(), micro() or converge() for people."""
+    if "target_tau" in report:
+        print("{players} players, round robin {round_robin} games, games to Kendall's tau {target_tau}:".format(**report))
+        for schedule in ["exhaustive", "rating"]:
+            r = report[schedule]
+            print("{:>10}: median {:.0f} games ({:.1%} of a round robin), runs {}, ranking confidence {:.3f}, {:.1f}s".format(
+                  schedule, r["median_games"], r["median_games"] / report["round_robin"], r["games"], r["confidence"], r["seconds"]))
+        return
+    if "turn_ms" not in report:
+        print("{players} players: scheduler sync {sync_ms:.1f}ms, choose_game+record {choose_game_us:.1f}us, "
+              "leader board {leader_board_ms:.1f}ms".format(**report))
+        return
+
+    print("{games} games ({failures} failed) of {players} players in {seconds:.2f}s "
+          "with {workers} workers: {games_per_sec:.1f} games/sec".format(**report))
+    print("take_turn ms: p50 {:.3f}  p95 {:.3f}  p99 {:.3f}  max {:.3f}".format(*report["turn_ms"].values()))
+    total = sum(report["phase_seconds"].values())
+    print("time in games: " + "  ".join("{} {:.2f}s ({:.0%})".format(p, t, t / total if total else 0)
+                                        for p,t in report["phase_seconds"].items()))
+    print("choose_game+record: {:.1f}us per game".format(report["choose_game_us"]))
+    for name, syn, w, l, d in report["standings"]:
+        print("{:>16} ({:2}) {:>6} wins {:>6} losses {:>6} draws".format(name, syn, w, l, d))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a tournament offline and report its speed.")
+    parser.add_argument("directory", nargs="?", default=os.path.join(os.path.dirname(__file__), "bots"),
+                        help="directory of name_syn.py player scripts (default the reference bots)")
+    parser.add_argument("--games", type=int, default=None, help="games to play (default a round robin)")
+    parser.add_argument("--workers", type=int, default=1, help="processes playing games in parallel")
+    parser.add_argument("--in-process", action="store_true", help="run players in this process, not sandboxes")
+    parser.add_argument("--micro", type=int, metavar="PLAYERS", help="only time choose_game and the leader board")
+    parser.add_argument("--converge", type=int, metavar="PLAYERS",
+                        help="only compare games the schedules need to rank synthetic players")
+    parser.add_argument("--target", type=float, default=0.9, help="Kendall's tau --converge aims for (default 0.9)")
+    parser.add_argument("--json", metavar="FILE", help="append the report as a JSON line to FILE")
+    parser.add_argument("--seed", type=int, help="seed the random module")
+    args = parser.parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    if args.micro:
+        report = micro(args.micro)
+    elif args.converge:
+        report = converge(args.converge, args.target, seed=args.seed or 0)
+    else:
+        report = run(load_players(args.directory), args.games, args.workers, not args.in_process)
+    print_report(report)
+
+    if args.json:
+        report["time"] = time.strftime("%Y-%m-%d %H:%M:%S")
+        with open(args.json, "a") as f:
+            f.write(json.dumps(report) + "\n")
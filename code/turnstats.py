@@ -0,0 +1,117 @@
+"""
+    How long each player takes over its turns, and what it uses doing so.
+
+    Turn times go into a histogram with 20 log spaced buckets per decade
+    from 1us to 100s, so memory per player is fixed and p50/p95 are
+    accurate to about 12%. Max is exact. CPU seconds and peak memory come
+    from the player's sandbox process, when it has one.
+
+    The stats also set each player's time policy. Once a player has taken
+    ADAPT_AFTER turns its turn limit tightens from Game.TIME to ADAPT_FACTOR
+    times its own p99 (never below ADAPT_FLOOR), so a hang is caught in
+    seconds rather than after the full limit. Running over the tightened
+    limit loses that game, where running over Game.TIME deletes the player,
+    so one turn slowed by a busy server costs little. Players taking more than
+    SLOW_GAME seconds of take_turn per game get a scheduling penalty, up to
+    MAX_PENALTY, so they are paired less often than quick ones.
+"""
+import numpy as np
+from threading import Lock
+
+EDGES = np.logspace(-6, 2, 161)   # bucket i holds times in [EDGES[i-1], EDGES[i])
+
+ADAPT_AFTER = 50     # turns seen before a player's turn limit tightens
+ADAPT_FACTOR = 20    # tightened turn limit is this times the player's p99 ...
+ADAPT_FLOOR = 2.0    # ... but at least this many seconds
+SLOW_GAME = 1.0      # seconds of take_turn per game before a player is scheduled less often
+MAX_PENALTY = 10     # most a slow player's games are spread out by
+
+class PlayerStats:
+    def __init__(self):
+        self.counts = np.zeros(len(EDGES) + 1, dtype=np.int64)
+        self.turns = 0
+        self.total = 0.0      # seconds in take_turn
+        self.max = 0.0
+        self.cpu = 0.0        # CPU seconds in take_turn
+        self.max_rss = 0      # peak memory of its process, kilobytes
+
+    def add(self, turn_times, cpu=None, max_rss=None):
+        """Add a game's take_turn times (seconds), CPU seconds and peak memory (kB)."""
+        if len(turn_times) > 0:
+            t = np.asarray(turn_times)
+            np.add.at(self.counts, np.searchsorted(EDGES, t, side="right"), 1)
+            self.turns += len(t)
+            self.total += float(t.sum())
+            self.max = max(self.max, float(t.max()))
+        if cpu is not None:
+            self.cpu += cpu
+        if max_rss is not None:
+            self.max_rss = max(self.max_rss, max_rss)
+
+    def percentile(self, q):
+        """Upper edge of the bucket holding the q'th percentile turn time (at most max), in seconds."""
+        if self.turns == 0:
+            return 0.0
+        i = int(np.searchsorted(np.cumsum(self.counts), q / 100.0 * self.turns))
+        return min(float(EDGES[min(i, len(EDGES) - 1)]), self.max)
+
+    def turn_limit(self, limit):
+        """Seconds to allow this player's next turn, at most limit."""
+        if self.turns < ADAPT_AFTER:
+            return limit
+        return min(limit, max(ADAPT_FLOOR, ADAPT_FACTOR * self.percentile(99)))
+
+    def penalty(self, turns_per_game):
+        """Scheduling penalty, 1 (none) to MAX_PENALTY, from the mean time of a game's turns."""
+        if self.turns == 0:
+            return 1.0
+        per_game = self.total / self.turns * turns_per_game
+        return min(MAX_PENALTY, max(1.0, per_game / SLOW_GAME))
+
+    def summary(self):
+        """Dictionary of the stats, times in milliseconds."""
+        return {"turns": self.turns,
+                "p50_ms": 1000 * self.percentile(50),
+                "p95_ms": 1000 * self.percentile(95),
+                "max_ms": 1000 * self.max,
+                "total_s": self.total,
+                "cpu_s": self.cpu,
+                "max_rss_kb": self.max_rss}
+
+class TurnStats:
+    """PlayerStats of every player, safe to read from any thread."""
+
+    def __init__(self):
+        self.players = {}    # (name, syn): PlayerStats
+        self.lock = Lock()
+
+    def add(self, k, turn_times, cpu=None, max_rss=None):
+        with self.lock:
+            if k not in self.players:
+                self.players[k] = PlayerStats()
+            self.players[k].add(turn_times, cpu, max_rss)
+
+    def remove(self, k):
+        with self.lock:
+            self.players.pop(k, None)
+
+    def summary(self, k):
+        """Dictionary of player k's stats, or None if it has none."""
+        with self.lock:
+            return self.players[k].summary() if k in self.players else None
+
+    def turn_limit(self, k, limit):
+        """Seconds to allow player k's next turn, at most limit."""
+        with self.lock:
+            return self.players[k].turn_limit(limit) if k in self.players else limit
+
+    def penalties(self, turns_per_game):
+        """Dictionary of (name, syn): scheduling penalty for players that have one."""
+        with self.lock:
+            p = {k:s.penalty(turns_per_game) for k,s in self.players.items()}
+        return {k:v for k,v in p.items() if v > 1}
+
+    def summaries(self):
+        """Dictionary of (name, syn): summary for every player."""
+        with self.lock:
+            return {k:p.summary() for k,p in self.players.items()}